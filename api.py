@@ -1,10 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from tracker import BehaviorTracker
-from model import BotDetector
+from model import load_detector
 from captcha import AdvancedCaptchaSystem
+from early_verdict import EarlyVerdictScorer, load_prefix_detector
+from event_frames import MOUSE_EVENT, TRACK_CONTENT_TYPE, decode_track_records
+from traffic import TrafficRecorder
+from snapshot import SessionSnapshotter
+from session_budget import SessionBudget
+from overload import OverloadController
+from source_rates import SourceRates
+from trajectory import ReplayDetector
+from feature_drift import DriftMonitor, profile_csv
+from feature_store import FeatureStore
+import numpy as np
+import clock
+import secrets
+import hmac
 import uuid
 import time
+import os
 
 app = Flask(__name__)
 CORS(app)  # Allow websites to use this API
@@ -12,34 +27,251 @@ CORS(app)  # Allow websites to use this API
 # Load the trained model
 print("🚀 Starting Advanced Intelligent CAPTCHA API...")
 print("📂 Loading trained model...")
-detector = BotDetector()
-detector.load('bot_detector.pkl')
+detector = load_detector('bot_detector.pkl')
+
+# Reuse scores for near-identical feature vectors (set to 0 to disable)
+SCORE_CACHE_SIZE = 10000
+if SCORE_CACHE_SIZE:
+    detector.enable_cache(max_size=SCORE_CACHE_SIZE)
 
 # Create advanced CAPTCHA system with quizzes
-captcha_system = AdvancedCaptchaSystem(detector)
+# With CAPTCHA_TOKEN_SECRET set, challenges are HMAC-signed tokens instead of
+# server-side state, so any worker sharing the secret can verify them
+CHALLENGE_TOKEN_SECRET = os.environ.get('CAPTCHA_TOKEN_SECRET')
+captcha_system = AdvancedCaptchaSystem(detector, token_secret=CHALLENGE_TOKEN_SECRET)
+
+# Keep ready-made quiz challenges so bursts don't build them on the request path
+CHALLENGE_POOL_DEPTH = 200
+if CHALLENGE_POOL_DEPTH:
+    captcha_system.enable_pool(target_depth=CHALLENGE_POOL_DEPTH, low_watermark=CHALLENGE_POOL_DEPTH // 4)
+
+# Under overload the API degrades: it keeps every other mouse event, scores
+# /api/verify with the first FAST_PATH_TREES trees only, and at worst turns
+# away new sessions (503 + Retry-After). It recovers on its own.
+FAST_PATH_TREES = 10
+OVERLOAD_MAX_IN_FLIGHT = 32
+OVERLOAD_LATENCY = 0.25  # seconds (moving average)
+detector.enable_fast_path(n_trees=FAST_PATH_TREES)
+overload = OverloadController(max_in_flight=OVERLOAD_MAX_IN_FLIGHT, latency_high=OVERLOAD_LATENCY)
 print("✅ System ready with quiz-based challenges!\n")
 
+# prefork.py runs this app in several worker processes, each with its own
+# sessions. A worker's session ids end in its number (2 hex digits) and its
+# session handles are congruent to it modulo WORKERS, so any worker can tell
+# which one owns a session (see session_owner)
+WORKER = int(os.environ['CAPTCHA_WORKER']) if 'CAPTCHA_WORKER' in os.environ else None
+WORKERS = int(os.environ.get('CAPTCHA_WORKERS', 1))
+
+def session_owner(data=None, body=None):
+    """
+    Worker number owning the session a request is about: data is a JSON
+    body, body a binary /api/track body. None if any worker can answer.
+    """
+    if WORKER is None:
+        return None
+    if body is not None:
+        try:
+            records = decode_track_records(body)
+        except ValueError:
+            return None
+        return int(records['handle'][0]) % WORKERS if len(records) else None
+    session_id = data.get('session_id') if isinstance(data, dict) else None
+    if not isinstance(session_id, str) or len(session_id) != 36:
+        return None
+    try:
+        owner = int(session_id[-2:], 16)
+    except ValueError:
+        return None
+    return owner if owner < WORKERS else None
+
 # Store active user sessions
 sessions = {}
+# Short numeric handles for binary /api/track bodies: handle -> session_id
+session_handles = {}
+handles_by_session = {}  # session_id -> handle, to drop handles without a scan
 # Store active CAPTCHAs for verification
 active_captchas = {}
+# Sessions expire after 10 minutes
+SESSION_TTL = 600
+
+def forget_sessions(session_ids):
+    """Drop everything kept for sessions that were removed from `sessions`"""
+    for session_id in session_ids:
+        active_captchas.pop(session_id, None)
+        handle = handles_by_session.pop(session_id, None)
+        if handle is not None:
+            session_handles.pop(handle, None)
+    session_budget.forget(session_ids)
+    replay_detector.forget(session_ids)
+
+# Memory budget: past either limit, decided and idle sessions are evicted first
+MAX_SESSIONS = 100000
+MAX_SESSION_BYTES = 512 * 1024 * 1024
+session_budget = SessionBudget(sessions, max_sessions=MAX_SESSIONS, max_bytes=MAX_SESSION_BYTES,
+                               on_evict=forget_sessions).start()
+
+# Once a session has its final verdict ('allow' or a passed quiz) its
+# events are replaced by a small summary until it expires
+compaction_stats = {'compacted': 0, 'bytes_reclaimed': 0}
+
+def compact_session(session_id, verdict, probability=None):
+    tracker = sessions.get(session_id)
+    if tracker is None or tracker.summary:
+        return
+    if feature_store:
+        feature_store.append(session_id, tracker.get_features(), verdict, probability)
+    compaction_stats['bytes_reclaimed'] += tracker.compact(verdict, probability)
+    compaction_stats['compacted'] += 1
+    session_budget.note_decided(session_id, tracker)
+
+# Sessions are saved to this file every SNAPSHOT_INTERVAL seconds and at
+# shutdown, and restored at startup, so a restart doesn't re-challenge users
+SNAPSHOT_FILE = os.environ.get('CAPTCHA_SNAPSHOT_FILE', 'sessions.snapshot')
+if WORKER is not None:
+    SNAPSHOT_FILE += f'.{WORKER}'
+SNAPSHOT_INTERVAL = 30
+snapshotter = SessionSnapshotter(SNAPSHOT_FILE, sessions, active_captchas, session_handles,
+                                 ttl=SESSION_TTL, interval=SNAPSHOT_INTERVAL)
+
+def enable_snapshots():
+    """Restore the last snapshot and keep saving new ones (call once, in the serving process)"""
+    try:
+        restored, expired = snapshotter.load()
+        print(f"♻️  Restored {restored} sessions from {SNAPSHOT_FILE} ({expired} expired)")
+        for handle, session_id in list(session_handles.items()):
+            handles_by_session[session_id] = handle
+        for session_id, tracker in list(sessions.items()):
+            session_budget.add(session_id, tracker)
+            if tracker.summary:
+                session_budget.note_decided(session_id)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Could not restore sessions: {e}")
+    snapshotter.start()
+
+# Rescore live sessions in the background (seconds between passes, 0 = off)
+# so /api/verify can usually answer from a precomputed verdict
+EARLY_VERDICT_INTERVAL = 0.5
+early_verdicts = None
+if EARLY_VERDICT_INTERVAL:
+    early_verdicts = EarlyVerdictScorer(load_prefix_detector(detector), sessions,
+                                        interval=EARLY_VERDICT_INTERVAL).start()
+
+# Sliding-window counts per client, keyed by its IP address and, if sent, by
+# its X-Client-Fingerprint header (counted separately, so rotating the header
+# doesn't escape the IP's limits): sources with many sessions, events or
+# failed quizzes get a higher bot probability, and past the hard limits are
+# turned away (429)
+CLIENT_KEY_HEADER = 'X-Client-Fingerprint'
+source_rates = SourceRates()
+
+# Prefork workers pass requests for another worker's session on over a local
+# port, marked with FORWARDED_HEADER and the original client's IP in
+# FORWARDED_FOR_HEADER. They are only believed with the secret the prefork
+# parent generated at launch (CAPTCHA_FORWARD_SECRET, set in each worker) in
+# FORWARD_SECRET_HEADER; on any other request all three are stripped.
+FORWARDED_HEADER = 'X-Captcha-Forwarded'
+FORWARDED_FOR_HEADER = 'X-Captcha-Client-IP'
+FORWARD_SECRET_HEADER = 'X-Captcha-Forward-Secret'
+INTERNAL_HEADERS = (FORWARDED_HEADER, FORWARDED_FOR_HEADER, FORWARD_SECRET_HEADER)
+FORWARD_SECRET = os.environ.get('CAPTCHA_FORWARD_SECRET')
+
+def client_keys(ip, fingerprint=None):
+    """Rate-limit keys for a client: its IP address, plus its fingerprint if it sent one"""
+    keys = (f'ip:{ip}',) if ip else ()
+    if fingerprint:
+        keys += (f'fp:{fingerprint}',)
+    return keys or None
+
+def limit_client(client, metric=None, count=1):
+    """
+    Count `count` events of `metric` for a client, then check its limits
+    Returns a (response, 429) to send instead, or None to carry on
+    """
+    if client is None:
+        return None
+    if metric:
+        source_rates.note(metric, client, count)
+    reason = source_rates.reject_reason(client)
+    if reason:
+        return {'error': 'Too many requests from this client', 'reason': reason,
+                'retry_after': int(source_rates.window)}, 429
+    return None
+
+# Mouse paths replayed across sessions (see trajectory.py) get at least
+# this bot probability
+REPLAY_RISK = 0.9
+replay_detector = ReplayDetector()
+
+# Live feature vectors are compared with the training distribution stored in
+# the model, so GET /api/drift shows when live traffic has moved away from it
+DRIFT_WINDOW = 3600  # seconds
+drift_profile = detector.feature_profile
+if drift_profile is None and os.path.exists('training_data.csv'):
+    # Model saved before profiles were stored: profile the training data instead
+    print("⚠️  Model has no feature profile, using training_data.csv")
+    drift_profile = profile_csv('training_data.csv', detector.feature_names)
+drift_monitor = DriftMonitor(drift_profile, window=DRIFT_WINDOW) if drift_profile else None
+
+# With CAPTCHA_FEATURE_STORE set, every decided session (allowed, quiz passed
+# or failed) is appended to that directory for retraining on real traffic:
+# python -c "from model import BotDetector; BotDetector().train('<dir>')"
+FEATURE_STORE_DIR = os.environ.get('CAPTCHA_FEATURE_STORE')
+feature_store = FeatureStore(FEATURE_STORE_DIR).start() if FEATURE_STORE_DIR else None
+
+# With CAPTCHA_TRAFFIC_LOG set, every API call is appended to that JSONL file
+# so it can be replayed later with: python traffic.py <file>
+TRAFFIC_LOG = os.environ.get('CAPTCHA_TRAFFIC_LOG')
+if TRAFFIC_LOG and WORKER is not None:
+    TRAFFIC_LOG += f'.worker{WORKER}'
+recorder = TrafficRecorder(TRAFFIC_LOG).start() if TRAFFIC_LOG else None
+
+@app.before_request
+def note_arrival():
+    g.arrived_at = clock.now()
+    g.client_ip = request.remote_addr
+    g.forwarded_by = None
+    secret = request.headers.get(FORWARD_SECRET_HEADER, '')
+    if FORWARD_SECRET and hmac.compare_digest(secret.encode(), FORWARD_SECRET.encode()):
+        g.forwarded_by = request.headers.get(FORWARDED_HEADER)
+        g.client_ip = request.headers.get(FORWARDED_FOR_HEADER) or g.client_ip
+    else:
+        # A public request: drop any internal headers the client made up
+        for name in INTERNAL_HEADERS:
+            request.environ.pop('HTTP_' + name.upper().replace('-', '_'), None)
+    g.client = client_keys(g.client_ip, request.headers.get(CLIENT_KEY_HEADER))
+    if request.path.startswith('/api/'):
+        g.started = time.perf_counter()
+        overload.request_started()
+
+@app.teardown_request
+def note_finished(error):
+    if 'started' in g:
+        overload.request_finished(time.perf_counter() - g.started, counted=not g.get('turned_away'))
+
+@app.after_request
+def record_traffic(response):
+    g.turned_away = response.status_code in (429, 503)
+    if recorder and request.path.startswith('/api/') and not g.get('forwarded'):
+        recorder.record(request.method, request.path, request.mimetype, request.get_data(),
+                        response.status_code, response.get_json(silent=True), g.arrived_at,
+                        client=g.client)
+    return response
 
 # Clean up old sessions (older than 10 minutes)
 def cleanup_old_sessions():
-    current_time = time.time()
+    current_time = clock.now()
     sessions_to_remove = []
     
-    for session_id, tracker in sessions.items():
+    for session_id, tracker in list(sessions.items()):
         # If session is older than 10 minutes (600 seconds)
-        if current_time - tracker.start_time > 600:
+        if current_time - tracker.start_time > SESSION_TTL:
             sessions_to_remove.append(session_id)
     
     for session_id in sessions_to_remove:
-        del sessions[session_id]
-        if session_id in active_captchas:
-            del active_captchas[session_id]
+        sessions.pop(session_id, None)
     
     if sessions_to_remove:
+        forget_sessions(sessions_to_remove)
         print(f"🧹 Cleaned up {len(sessions_to_remove)} old sessions")
 
 @app.route('/')
@@ -288,7 +520,7 @@ def home():
                     <span class="method">POST</span> <code>/api/session/start</code>
                     <div class="endpoint-desc">
                         Start a new tracking session. Returns a unique session ID.
-                        <br><strong>Response:</strong> <code>{{"session_id": "...", "success": true}}</code>
+                        <br><strong>Response:</strong> <code>{{"session_id": "...", "session_handle": 123, "success": true}}</code>
                     </div>
                 </div>
                 
@@ -298,6 +530,7 @@ def home():
                         Track user behavior (mouse movements, keystrokes).
                         <br><strong>Body:</strong> <code>{{"session_id": "...", "type": "mouse", "x": 100, "y": 200}}</code>
                         <br><strong>Types:</strong> "mouse" or "keyboard"
+                        <br><strong>Binary:</strong> with <code>Content-Type: application/x-captcha-events</code>, send 13-byte records (uint32 session_handle, type byte 0=mouse 1=keyboard, int16 x, int16 y, uint32 ms since start), big-endian
                     </div>
                 </div>
                 
@@ -310,11 +543,21 @@ def home():
                     </div>
                 </div>
                 
+                <div class="endpoint">
+                    <span class="method">POST</span> <code>/api/verify/batch</code>
+                    <div class="endpoint-desc">
+                        Risk assessment for many sessions with one model call (for audits).
+                        <br><strong>Body:</strong> <code>{{"session_ids": ["...", "..."]}}</code>
+                        <br><strong>Returns:</strong> Columns: probability, risk_level, action, captcha_type
+                    </div>
+                </div>
+                
                 <div class="endpoint">
                     <span class="method">POST</span> <code>/api/verify/quiz</code>
                     <div class="endpoint-desc">
                         Submit quiz answer for verification.
                         <br><strong>Body:</strong> <code>{{"session_id": "...", "response": {{"answer": "...", "response_time": 5.5}}}}</code>
+                        <br><strong>Signed-token mode:</strong> also send the <code>"token"</code> from the challenge
                         <br><strong>Returns:</strong> Verification result with explanation
                     </div>
                 </div>
@@ -327,6 +570,14 @@ def home():
                     </div>
                 </div>
                 
+                <div class="endpoint">
+                    <span class="method get">GET</span> <code>/api/drift</code>
+                    <div class="endpoint-desc">
+                        Compare live feature values with the training data.
+                        <br><strong>Returns:</strong> PSI and KS score per feature, drifted features, retrain_suggested
+                    </div>
+                </div>
+                
                 <div class="endpoint">
                     <span class="method get">GET</span> <code>/api/health</code>
                     <div class="endpoint-desc">
@@ -368,65 +619,172 @@ def home():
     </html>
     """
 
-@app.route('/api/session/start', methods=['POST'])
-def start_session():
+# Request handlers shared by the Flask app and the asyncio app (api_async.py)
+def handle_session_start(client=None):
     """
     Start a new tracking session for a user
+    Returns (response dict, HTTP status)
     """
+    rejected = limit_client(client, 'session_starts')
+    if rejected:
+        return rejected
+    
+    if overload.shedding:
+        overload.stats['rejected_sessions'] += 1
+        return {'error': 'Server is busy, please try again shortly',
+                'retry_after': overload.retry_after}, 503
+    
     cleanup_old_sessions()
     
     session_id = str(uuid.uuid4())  # Generate unique ID
-    sessions[session_id] = BehaviorTracker()
+    if WORKER is not None:
+        session_id = session_id[:-2] + f'{WORKER:02x}'
+    tracker = BehaviorTracker()
+    sessions[session_id] = tracker
+    
+    # Random (not sequential) so one client can't guess another's handle
+    def new_handle():
+        return secrets.randbits(32) % (2**32 // WORKERS) * WORKERS + (WORKER or 0)
+    handle = new_handle()
+    while handle in session_handles:
+        handle = new_handle()
+    session_handles[handle] = session_id
+    handles_by_session[session_id] = handle
+    session_budget.add(session_id, tracker)
+    session_budget.enforce()
     
     print(f"🆕 New session started: {session_id[:8]}...")
     
-    return jsonify({
+    return {
         'success': True,
         'session_id': session_id,
+        'session_handle': handle,
         'message': 'Session started. Behavior tracking enabled with quiz-based verification.'
-    })
+    }, 200
 
-@app.route('/api/track', methods=['POST'])
-def track_behavior():
+def handle_track(data, client=None):
     """
     Record user behavior (mouse movements, keystrokes)
+    Returns (response dict, HTTP status)
     """
-    data = request.json
-    session_id = data.get('session_id')
+    rejected = limit_client(client, 'track_events')
+    if rejected:
+        return rejected
     
-    if not session_id or session_id not in sessions:
-        return jsonify({'error': 'Invalid session ID'}), 400
+    session_id = data.get('session_id')
     
-    tracker = sessions[session_id]
+    # get() rather than `in` then []: the session may be evicted in between
+    tracker = sessions.get(session_id) if session_id else None
+    if tracker is None:
+        return {'error': 'Invalid session ID'}, 400
     
     # Track based on event type
     if data.get('type') == 'mouse':
+        if overload.degraded and (len(tracker.mouse_x) + tracker.mouse_skipped) % 2:
+            # Overloaded: count every other mouse movement without storing it
+            tracker.skip_mouse_movements()
+            overload.stats['thinned_events'] += 1
+            session_budget.touch(session_id)
+            return {'success': True, 'degraded': True}, 200
         tracker.add_mouse_movement(data['x'], data['y'])
     elif data.get('type') == 'keyboard':
         tracker.add_keystroke(data.get('key', ''))
+    session_budget.touch(session_id, tracker)
     
-    return jsonify({'success': True})
+    return {'success': True}, 200
 
-@app.route('/api/verify', methods=['POST'])
-def verify_user():
+def handle_track_binary(body, client=None):
+    """
+    Record a batch of binary tracking events (see event_frames.py)
+    Returns (response dict, HTTP status)
+    """
+    try:
+        records = decode_track_records(body)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    
+    rejected = limit_client(client, 'track_events', len(records))
+    if rejected:
+        return rejected
+    
+    recorded = 0
+    for handle in np.unique(records['handle']):
+        session_id = session_handles.get(int(handle))
+        tracker = sessions.get(session_id)
+        if tracker is None:
+            continue
+        rows = records[records['handle'] == handle]
+        if overload.degraded:
+            rows = _thin_mouse_rows(tracker, rows)
+        timestamps = tracker.start_time + rows['ms'] / 1000.0
+        tracker.add_events(rows['type'], rows['x'], rows['y'], timestamps)
+        session_budget.touch(session_id, tracker)
+        recorded += len(rows)
+    
+    if recorded == 0 and len(records):
+        return {'error': 'Invalid session handle'}, 400
+    if overload.degraded:
+        return {'success': True, 'recorded': recorded, 'degraded': True}, 200
+    return {'success': True, 'recorded': recorded}, 200
+
+def _thin_mouse_rows(tracker, rows):
+    """Keep every other mouse record (continuing the session's count), like handle_track"""
+    mouse = rows['type'] == MOUSE_EVENT
+    index = len(tracker.mouse_x) + tracker.mouse_skipped + np.cumsum(mouse) - 1
+    dropped = mouse & (index % 2 == 1)
+    skipped = int(dropped.sum())
+    tracker.skip_mouse_movements(skipped)
+    overload.stats['thinned_events'] += skipped
+    return rows[~dropped]
+
+def handle_verify(data, client=None):
     """
     Analyze behavior and decide if CAPTCHA/quiz is needed
+    Returns (response dict, HTTP status)
     """
-    data = request.json
-    session_id = data.get('session_id')
+    rejected = limit_client(client)
+    if rejected:
+        return rejected
     
-    if not session_id or session_id not in sessions:
-        return jsonify({'error': 'Invalid session ID'}), 400
+    session_id = data.get('session_id')
     
     # Get tracked behavior
-    tracker = sessions[session_id]
+    tracker = sessions.get(session_id) if session_id else None
+    if tracker is None:
+        return {'error': 'Invalid session ID'}, 400
+    session_budget.touch(session_id)
     features = tracker.get_features()
+    if drift_monitor and not tracker.drift_observed:
+        # One vector per session (its first verify), however often it is verified
+        tracker.drift_observed = True
+        drift_monitor.observe(features)
     
     print(f"\n📊 Verifying session {session_id[:8]}...")
     print(f"   Features: {features}")
     
-    # Check with CAPTCHA system
-    result = captcha_system.check_user(features)
+    # Busy sources and replayed mouse paths get a higher bot probability
+    source_risk = source_rates.risk(client) if client else 0.0
+    replay = replay_detector.check(session_id, tracker)
+    if replay and replay['replayed']:
+        source_risk = max(source_risk, REPLAY_RISK)
+        print(f"   🔁 Replayed trajectory ({replay['matched_bands']} matching bands)")
+    
+    # Use the early verdict if the session already settled, else run the model
+    verdict = early_verdicts.verdict(session_id) if early_verdicts else None
+    if verdict:
+        result = captcha_system.check_probability(verdict['probability'], source_risk)
+        result['precomputed'] = True
+        print(f"   ⚡ Early verdict ({verdict['verdict']}) after {verdict['events']} events")
+    elif overload.degraded:
+        # Overloaded: a smaller forest is cheaper and close enough
+        result = captcha_system.check_probability(detector.predict_fast(features), source_risk)
+        result['degraded'] = True
+        overload.stats['cheap_verifies'] += 1
+        print(f"   🟠 Degraded mode: fast scoring")
+    else:
+        result = captcha_system.check_user(features, source_risk)
+    
+    result['replayed_trajectory'] = bool(replay and replay['replayed'])
     
     print(f"   Bot Probability: {result['probability']*100:.1f}%")
     print(f"   Risk Level: {result['risk_level']}")
@@ -434,14 +792,15 @@ def verify_user():
     
     # Add CAPTCHA/Quiz if needed
     if result['action'] != 'allow':
-        captcha = captcha_system.generate_captcha(result.get('captcha_type'))
+        captcha = captcha_system.generate_captcha(result.get('captcha_type'), session_id=session_id)
         result['captcha'] = captcha
         
-        # Store CAPTCHA for later verification
-        active_captchas[session_id] = {
-            'captcha': captcha,
-            'generated_at': time.time()
-        }
+        # Store CAPTCHA for later verification (signed tokens carry their own state)
+        if 'token' not in captcha:
+            active_captchas[session_id] = {
+                'captcha': captcha,
+                'generated_at': clock.now()
+            }
         
         print(f"   CAPTCHA Type: {captcha['type']}")
         if captcha['type'] == 'quiz':
@@ -450,81 +809,221 @@ def verify_user():
             print(f"   Total Questions: {captcha['total_questions']}")
     else:
         print(f"   ✅ Access granted - No CAPTCHA needed")
+        compact_session(session_id, 'allow', result['probability'])
     
-    return jsonify(result)
+    return result, 200
 
-@app.route('/api/verify/quiz', methods=['POST'])
-def verify_quiz():
+def handle_verify_batch(data):
     """
-    Verify user's quiz answer submission
+    Risk assessment for many sessions in one model call (no CAPTCHAs issued)
+    Returns (response dict, HTTP status)
     """
-    data = request.json
-    session_id = data.get('session_id')
-    user_response = data.get('response')
+    trackers = {sid: sessions.get(sid) for sid in data.get('session_ids', [])}
+    trackers = {sid: tracker for sid, tracker in trackers.items() if tracker is not None}
+    session_ids = list(trackers)
+    
+    if not session_ids:
+        return {'error': 'No valid session IDs'}, 400
     
-    if not session_id or session_id not in sessions:
-        return jsonify({'error': 'Invalid session ID'}), 400
+    results = captcha_system.check_users([tracker.get_features() for tracker in trackers.values()])
     
-    if session_id not in active_captchas:
-        return jsonify({'error': 'No active CAPTCHA for this session'}), 400
+    return {
+        'session_ids': session_ids,
+        'probability': results['probability'].tolist(),
+        'risk_level': results['risk_level'].tolist(),
+        'action': results['action'].tolist(),
+        'captcha_type': results['captcha_type'].tolist()
+    }, 200
+
+def handle_verify_quiz(data, client=None):
+    """
+    Verify user's quiz answer submission
+    Returns (response dict, HTTP status)
+    """
+    rejected = limit_client(client)
+    if rejected:
+        return rejected
     
-    captcha_data = active_captchas[session_id]
-    captcha = captcha_data['captcha']
+    session_id = data.get('session_id')
+    user_response = data.get('response')
+    token = data.get('token')
     
-    # Calculate response time if not provided
-    if 'response_time' not in user_response:
-        user_response['response_time'] = time.time() - captcha_data['generated_at']
+    if not session_id:
+        return {'error': 'Invalid session ID'}, 400
+    if not isinstance(user_response, dict):
+        return {'error': 'Missing response'}, 400
     
-    # Verify the response
-    verification = captcha_system.verify_captcha_response(captcha, user_response)
+    if token:
+        # Signed-token mode: everything needed is inside the token
+        verification = captcha_system.verify_captcha_response(token, user_response, session_id=session_id)
+        captcha_type = verification.get('type', 'unknown')
+    else:
+        if session_id not in sessions:
+            return {'error': 'Invalid session ID'}, 400
+        
+        if session_id not in active_captchas:
+            return {'error': 'No active CAPTCHA for this session'}, 400
+        session_budget.touch(session_id)
+        
+        captcha_data = active_captchas[session_id]
+        captcha = captcha_data['captcha']
+        captcha_type = captcha['type']
+        
+        # Calculate response time if not provided
+        if 'response_time' not in user_response:
+            user_response['response_time'] = clock.now() - captcha_data['generated_at']
+        
+        # Verify the response
+        verification = captcha_system.verify_captcha_response(captcha, user_response)
     
     print(f"\n✅ Quiz verification for {session_id[:8]}...")
-    print(f"   Type: {captcha['type']}")
+    print(f"   Type: {captcha_type}")
     print(f"   Verified: {verification['verified']}")
     print(f"   Reason: {verification['reason']}")
     
-    if captcha['type'] == 'multi_quiz' and 'score' in verification:
+    if captcha_type == 'multi_quiz' and 'score' in verification:
         print(f"   Score: {verification['score']}/{verification['total']}")
     
     # Clear CAPTCHA if verified successfully
     if verification['verified']:
-        del active_captchas[session_id]
+        active_captchas.pop(session_id, None)
         verification['message'] = 'Quiz solved correctly! Access granted. ✅'
         verification['access_granted'] = True
+        compact_session(session_id, 'quiz_passed')
     else:
         verification['message'] = 'Quiz failed. Please try again. ❌'
         verification['access_granted'] = False
+        if client:
+            source_rates.note('failed_quizzes', client)
+        tracker = sessions.get(session_id)
+        if feature_store and tracker is not None:
+            feature_store.append(session_id, tracker.get_features(), 'quiz_failed')
     
-    return jsonify(verification)
+    return verification, 200
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
+def handle_stats():
     """
     Get system statistics
+    Returns (response dict, HTTP status)
     """
     cleanup_old_sessions()
     stats = captcha_system.get_statistics()
     
-    return jsonify({
+    return {
+        'worker': WORKER,
         'active_sessions': len(sessions),
         'active_captchas': len(active_captchas),
         'model_trained': detector.is_trained,
         'quiz_database': stats['quiz_database'],
-        'thresholds': stats['thresholds']
-    })
+        'thresholds': stats['thresholds'],
+        'risk_tiers': stats['risk_tiers'],
+        'score_cache': stats.get('score_cache'),
+        'signed_tokens': stats['signed_tokens'],
+        'token_replay_set': stats.get('token_replay_set'),
+        'challenge_pool': stats.get('challenge_pool'),
+        'early_verdicts': early_verdicts.get_statistics() if early_verdicts else None,
+        'snapshots': snapshotter.get_statistics(),
+        'compaction': {**compaction_stats,
+                       'compacted_sessions': sum(1 for t in list(sessions.values()) if t.summary)},
+        'memory_budget': session_budget.get_statistics(),
+        'overload': overload.get_statistics(),
+        'source_rates': source_rates.get_statistics(),
+        'replay_detection': replay_detector.get_statistics(),
+        'feature_drift': drift_monitor.get_statistics() if drift_monitor else None,
+        'feature_store': feature_store.get_statistics() if feature_store else None
+    }, 200
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
+def handle_drift():
+    """
+    Drift of live features from the training distribution (PSI and KS per feature)
+    Returns (response dict, HTTP status)
+    """
+    if drift_monitor is None:
+        return {'error': 'The model has no feature profile - retrain it to monitor drift'}, 404
+    return drift_monitor.scores(), 200
+
+def handle_health():
     """
     Health check endpoint
+    Returns (response dict, HTTP status)
     """
-    return jsonify({
+    return {
         'status': 'healthy',
         'timestamp': time.time(),
         'system': 'Advanced Intelligent CAPTCHA API',
         'version': '2.0',
         'features': ['ML Detection', 'Quiz Challenges', 'Adaptive Risk']
-    })
+    }, 200
+
+# Flask routes
+def json_response(payload, status):
+    """JSON response; turned-away requests (429/503) also get a Retry-After header"""
+    if status in (429, 503):
+        return jsonify(payload), status, {'Retry-After': str(payload['retry_after'])}
+    return jsonify(payload), status
+
+@app.route('/api/session/start', methods=['POST'])
+def start_session():
+    """
+    Start a new tracking session for a user
+    """
+    return json_response(*handle_session_start(client=g.client))
+
+@app.route('/api/track', methods=['POST'])
+def track_behavior():
+    """
+    Record user behavior (mouse movements, keystrokes)
+    Accepts JSON or binary events (Content-Type: application/x-captcha-events)
+    """
+    if request.mimetype == TRACK_CONTENT_TYPE:
+        return json_response(*handle_track_binary(request.get_data(), client=g.client))
+    return json_response(*handle_track(request.json, client=g.client))
+
+@app.route('/api/verify', methods=['POST'])
+def verify_user():
+    """
+    Analyze behavior and decide if CAPTCHA/quiz is needed
+    """
+    return json_response(*handle_verify(request.json, client=g.client))
+
+@app.route('/api/verify/batch', methods=['POST'])
+def verify_batch():
+    """
+    Risk assessment for many sessions in one model call (no CAPTCHAs issued)
+    """
+    payload, status = handle_verify_batch(request.json)
+    return jsonify(payload), status
+
+@app.route('/api/verify/quiz', methods=['POST'])
+def verify_quiz():
+    """
+    Verify user's quiz answer submission
+    """
+    return json_response(*handle_verify_quiz(request.json, client=g.client))
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """
+    Get system statistics
+    """
+    payload, status = handle_stats()
+    return jsonify(payload), status
+
+@app.route('/api/drift', methods=['GET'])
+def get_drift():
+    """
+    Drift of live features from the training distribution
+    """
+    payload, status = handle_drift()
+    return jsonify(payload), status
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """
+    Health check endpoint
+    """
+    payload, status = handle_health()
+    return jsonify(payload), status
 
 if __name__ == '__main__':
     print("\n" + "=" * 70)
@@ -543,4 +1042,8 @@ if __name__ == '__main__':
     print("\n💡 Press Ctrl+C to stop the server\n")
     print("=" * 70 + "\n")
     
+    # The debug reloader runs the app in a child process; only that one keeps snapshots
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        enable_snapshots()
+    
     app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs
+import api  # Shares sessions, detector and captcha_system with the Flask app
+import clock
+from event_frames import TRACK_CONTENT_TYPE, apply_frame
+
+# Model calls are CPU-bound, so they run on a small thread pool instead of
+# blocking the event loop. Everything else is cheap and runs inline.
+MODEL_WORKERS = 4
+executor = ThreadPoolExecutor(max_workers=MODEL_WORKERS, thread_name_prefix='model')
+
+# (method, path) -> (handler, takes JSON body, runs the model, counted per client)
+ROUTES = {
+    ('POST', '/api/session/start'): (api.handle_session_start, False, False, True),
+    ('POST', '/api/track'): (api.handle_track, True, False, True),
+    ('POST', '/api/verify'): (api.handle_verify, True, True, True),
+    ('POST', '/api/verify/batch'): (api.handle_verify_batch, True, True, False),
+    ('POST', '/api/verify/quiz'): (api.handle_verify_quiz, True, False, True),
+    ('GET', '/api/stats'): (api.handle_stats, False, False, False),
+    ('GET', '/api/drift'): (api.handle_drift, False, False, False),
+    ('GET', '/api/health'): (api.handle_health, False, False, False),
+}
+
+# Same as flask_cors defaults: allow any website to call the API
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+]
+
+# WebSocket event stream: ws://host:5000/api/stream?session_id=...
+STREAM_PATH = '/api/stream'
+# Push a live verdict once the model is this sure either way
+VERDICT_CONFIDENCE = 0.8
+MIN_VERDICT_EVENTS = 50  # Don't judge a session on fewer events
+VERDICT_CHECK_EVERY = 10  # Re-check the model every N events
+
+def content_type(scope):
+    for name, value in scope['headers']:
+        if name == b'content-type':
+            return value.decode('latin-1').split(';')[0].strip().lower()
+    return ''
+
+def client_key(scope):
+    """Same keys as the Flask app: the client's IP, plus the fingerprint header if sent"""
+    header = api.CLIENT_KEY_HEADER.lower().encode()
+    fingerprint = None
+    for name, value in scope['headers']:
+        if name == header and value:
+            fingerprint = value.decode('latin-1')
+    return api.client_keys(scope['client'][0] if scope.get('client') else None, fingerprint)
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def send_response(send, status, body, content_type=b'application/json', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type),
+                    (b'content-length', str(len(body)).encode())] + CORS_HEADERS + list(headers)
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_json(send, payload, status=200, headers=()):
+    await send_response(send, status, json.dumps(payload).encode(), headers=headers)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            api.enable_snapshots()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            api.snapshotter.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def stream_events(scope, receive, send):
+    """
+    One WebSocket per session: every frame is a tracking event (see
+    event_frames.py). Once check_user is confident, the verdict is pushed
+    to the client as a JSON text message.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    session_id = query.get('session_id', [''])[0]
+    
+    await receive()  # websocket.connect
+    client = client_key(scope)
+    tracker = api.sessions.get(session_id)
+    if tracker is None or api.limit_client(client):
+        # Closing before accepting rejects the handshake (HTTP 403)
+        return await send({'type': 'websocket.close', 'code': 1008})
+    await send({'type': 'websocket.accept'})
+    
+    loop = asyncio.get_running_loop()
+    events = 0
+    verdict_sent = False
+    # Traffic log entries for this stream (method 'WS'): a body is an event,
+    # no body is a verdict check with its result as the response
+    route = f'{STREAM_PATH}?session_id={session_id}'
+    
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        arrived_at = clock.now()
+        
+        try:
+            if message.get('bytes') is not None:
+                rejected = api.limit_client(client, 'track_events')
+                if rejected:
+                    raise ValueError(rejected[0]['error'])
+                apply_frame(tracker, message['bytes'])
+                api.session_budget.touch(session_id, tracker)
+                if api.recorder:
+                    api.recorder.record('WS', route, 'application/octet-stream', message['bytes'], 200, None,
+                                        arrived_at, client=client)
+            else:
+                data = json.loads(message.get('text') or 'null')
+                payload, status = api.handle_track({**data, 'session_id': session_id}, client=client)
+                if status != 200:
+                    raise ValueError(payload['error'])
+                if api.recorder:
+                    api.recorder.record('WS', route, 'application/json', message['text'].encode(), 200, None,
+                                        arrived_at, client=client)
+        except (ValueError, KeyError, TypeError) as e:
+            await send({'type': 'websocket.send', 'text': json.dumps({'type': 'error', 'error': str(e)})})
+            continue
+        
+        events += 1
+        if verdict_sent or events < MIN_VERDICT_EVENTS or events % VERDICT_CHECK_EVERY:
+            continue
+        
+        source_risk = api.source_rates.risk(client) if client else 0.0
+        verdict = api.early_verdicts.verdict(session_id) if api.early_verdicts else None
+        if verdict:
+            result = {**api.captcha_system.check_probability(verdict['probability'], source_risk), 'precomputed': True}
+        else:
+            result = await loop.run_in_executor(executor, api.captcha_system.check_user,
+                                                tracker.get_features(), source_risk)
+        if api.recorder:
+            api.recorder.record('WS', route, None, b'', 200, result, arrived_at, client=client)
+        if max(result['probability'], 1 - result['probability']) >= VERDICT_CONFIDENCE:
+            verdict_sent = True
+            await send({'type': 'websocket.send', 'text': json.dumps({'type': 'verdict', 'events': events, **result})})
+
+async def app(scope, receive, send):
+    """
+    ASGI app with the same routes as the Flask app in api.py,
+    plus the WebSocket event stream at /api/stream
+    Run with: uvicorn api_async:app --port 5000
+    """
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'websocket':
+        if scope['path'] == STREAM_PATH:
+            return await stream_events(scope, receive, send)
+        await receive()
+        return await send({'type': 'websocket.close', 'code': 1008})
+    if scope['type'] != 'http':
+        return
+    
+    method, path = scope['method'], scope['path']
+    
+    # CORS preflight
+    if method == 'OPTIONS':
+        return await send_response(send, 204, b'')
+    
+    if path == '/' and method == 'GET':
+        return await send_response(send, 200, api.home().encode(), b'text/html; charset=utf-8')
+    
+    route = ROUTES.get((method, path))
+    if route is None:
+        return await send_json(send, {'error': 'Not found'}, 404)
+    
+    started = time.perf_counter()
+    api.overload.request_started()
+    status = 500
+    try:
+        status = await handle_route(route, method, path, scope, receive, send)
+    finally:
+        api.overload.request_finished(time.perf_counter() - started, counted=status not in (429, 503))
+
+async def handle_route(route, method, path, scope, receive, send):
+    """Run one API route and send its response; returns the HTTP status"""
+    handler, takes_body, runs_model, per_client = route
+    
+    arrived_at = clock.now()
+    client = client_key(scope)
+    kwargs = {'client': client} if per_client else {}
+    args = ()
+    body = b''
+    if path == '/api/track' and content_type(scope) == TRACK_CONTENT_TYPE:
+        handler, takes_body = api.handle_track_binary, False
+        body = await read_body(receive)
+        args = (body,)
+    
+    if takes_body:
+        body = await read_body(receive)
+        try:
+            data = json.loads(body or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await send_json(send, {'error': 'Expected a JSON object'}, 400)
+            return 400
+        args = (data,)
+    
+    if runs_model:
+        loop = asyncio.get_running_loop()
+        payload, status = await loop.run_in_executor(executor, partial(handler, *args, **kwargs))
+    else:
+        payload, status = handler(*args, **kwargs)
+    
+    headers = [(b'retry-after', str(payload['retry_after']).encode())] if status in (429, 503) else []
+    await send_json(send, payload, status, headers)
+    
+    # Same traffic log as the Flask app (CAPTCHA_TRAFFIC_LOG)
+    if api.recorder:
+        api.recorder.record(method, path, content_type(scope), body, status, payload, arrived_at,
+                            client=client)
+    return status
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ The asyncio server needs an ASGI server: pip install \"uvicorn[standard]\"")
+    else:
+        print("\n🚀 Async CAPTCHA API running at: http://localhost:5000")
+        uvicorn.run(app, host='0.0.0.0', port=5000, log_level='warning')
@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from event_frames import (MOUSE_EVENT, KEY_EVENT, TRACK_RECORD, TRACK_RECORD_DTYPE,
+                          decode_track_records, encode_track_event)
+from model import BotDetector
+from risk_tiers import RiskTierTable, DEFAULT_TIER_FILE
+from tracker import BehaviorTracker
+
+# Offline scoring of logged sessions
+#
+# JSONL logs have one session per line:
+#   {"session_id": "...", "events": [{"type": "mouse", "x": 1, "y": 2, "t": 0.25},
+#                                    {"type": "keyboard", "key": "a", "t": 0.5}],
+#    "duration": 12.5, "is_bot": 0}
+# t is seconds since the session started; duration (default: last event)
+# and is_bot (a label, used to report accuracy) are optional.
+#
+# Binary logs are /api/track records (see event_frames.py) with each
+# session's records stored together; the handle is the session id.
+#
+# The main process only reads blocks of the log and writes results; parsing,
+# feature extraction and scoring happen on a process pool. At most
+# 2 blocks per worker are in flight, so memory use doesn't grow with the log.
+
+OUTPUT_HEADER = 'session_id,probability,risk_level,action\n'
+
+# Per-worker state, set up once by _init_worker
+_worker = {}
+
+def _init_worker(model_file, tier_file):
+    detector = BotDetector()
+    detector.load(model_file)
+    _worker['detector'] = detector
+    _worker['tiers'] = RiskTierTable.load(tier_file)
+
+def features_from_session(session):
+    """Replay a logged session through BehaviorTracker"""
+    tracker = BehaviorTracker()
+    tracker.start_time = 0.0
+    last = 0.0
+    for event in session['events']:
+        t = float(event.get('t', 0.0))
+        last = max(last, t)
+        if event.get('type') == 'mouse':
+            tracker.add_mouse_movement(event['x'], event['y'], timestamp=t)
+        elif event.get('type') == 'keyboard':
+            tracker.add_keystroke(event.get('key', ''), timestamp=t)
+    return tracker.get_features(now=session.get('duration', last)), len(session['events'])
+
+def extract_binary_features(records, feature_names):
+    """
+    Features for every session in a block of records, without a tracker
+    Same numbers as BehaviorTracker; records of a session must be contiguous.
+    Returns (session handles, feature matrix in feature_names order)
+    """
+    handles = records['handle']
+    new_session = np.r_[True, handles[1:] != handles[:-1]]
+    starts = np.flatnonzero(new_session)
+    session = np.cumsum(new_session) - 1
+    n = len(starts)
+    
+    is_mouse = records['type'] == MOUSE_EVENT
+    mouse_count = np.bincount(session[is_mouse], minlength=n)
+    keystroke_count = np.bincount(session[records['type'] == KEY_EVENT], minlength=n)
+    session_duration = np.maximum.reduceat(records['ms'].astype(np.float64), starts) / 1000.0
+    
+    # Speeds between consecutive mouse points of the same session
+    mouse = records[is_mouse]
+    mouse_session = session[is_mouse]
+    time_diff = np.diff(mouse['ms'].astype(np.float64)) / 1000.0
+    distance = np.hypot(np.diff(mouse['x'].astype(np.float64)), np.diff(mouse['y'].astype(np.float64)))
+    moving = (mouse_session[1:] == mouse_session[:-1]) & (time_diff > 0)
+    owner = mouse_session[1:][moving]
+    speed_sum = np.bincount(owner, weights=distance[moving] / time_diff[moving], minlength=n)
+    speed_count = np.bincount(owner, minlength=n)
+    
+    columns = {
+        'mouse_count': mouse_count,
+        'avg_mouse_speed': np.divide(speed_sum, speed_count, out=np.zeros(n), where=speed_count > 0),
+        'keystroke_count': keystroke_count,
+        'typing_speed': np.divide(keystroke_count, session_duration, out=np.zeros(n),
+                                  where=session_duration > 0),
+        'session_duration': session_duration
+    }
+    matrix = np.column_stack([columns[name].astype(np.float64) for name in feature_names])
+    return handles[starts], matrix
+
+def _format_rows(session_ids, probabilities):
+    tiers = _worker['tiers']
+    index = np.searchsorted(tiers.bounds_array, probabilities, side='right')
+    return ''.join(
+        f"{sid},{p:.4f},{tiers.risk_levels[i]},{tiers.actions[i]}\n"
+        for sid, p, i in zip(session_ids, probabilities, index)
+    )
+
+def _score_json_block(lines):
+    """Parse, extract and score a block of JSONL lines (runs in a worker)"""
+    session_ids, features, labels = [], [], []
+    events = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        session = json.loads(line)
+        session_features, session_events = features_from_session(session)
+        session_ids.append(str(session.get('session_id', '')).replace(',', '_'))
+        features.append(session_features)
+        labels.append(session.get('is_bot'))
+        events += session_events
+    
+    probabilities = _worker['detector'].predict_batch(features)
+    labelled = [(p >= 0.5) == bool(label) for p, label in zip(probabilities, labels) if label is not None]
+    return _format_rows(session_ids, probabilities), len(session_ids), events, sum(labelled), len(labelled)
+
+def _score_binary_block(body):
+    """Extract and score a block of binary records (runs in a worker)"""
+    detector = _worker['detector']
+    records = decode_track_records(body)
+    if len(records) == 0:
+        return '', 0, 0, 0, 0
+    handles, matrix = extract_binary_features(records, detector.feature_names)
+    probabilities = detector.predict_batch(matrix)
+    return _format_rows(handles, probabilities), len(handles), len(records), 0, 0
+
+def read_json_blocks(path, block_size):
+    """Lists of up to block_size lines"""
+    with open(path, encoding='utf-8') as f:
+        block = []
+        for line in f:
+            block.append(line)
+            if len(block) >= block_size:
+                yield block
+                block = []
+        if block:
+            yield block
+
+def read_binary_blocks(path, block_size):
+    """
+    Byte blocks of whole sessions (block_size is counted in records)
+    The last session of a read is held back in case it continues in the next one
+    """
+    carry = b''
+    with open(path, 'rb') as f:
+        while True:
+            raw = f.read(block_size * TRACK_RECORD.size)
+            if not raw:
+                break
+            if len(raw) % TRACK_RECORD.size:
+                raise ValueError(f'{path} ends with a partial record')
+            raw = carry + raw
+            handles = np.frombuffer(raw, dtype=TRACK_RECORD_DTYPE)['handle']
+            
+            others = np.flatnonzero(handles != handles[-1])
+            cut = (others[-1] + 1) * TRACK_RECORD.size if len(others) else 0
+            if cut:
+                yield raw[:cut]
+            carry = raw[cut:]
+    if carry:
+        yield carry
+
+LOG_FORMATS = ('jsonl', 'binary')
+
+def is_binary_log(path, log_format=None):
+    """log_format ('jsonl' or 'binary') if given, else guessed from the file name"""
+    if log_format:
+        return log_format == 'binary'
+    return not path.endswith(('.jsonl', '.json'))
+
+def score_log(source, output, model_file='bot_detector.pkl', tier_file=DEFAULT_TIER_FILE,
+              workers=None, block_size=None, report_every=5.0, log_format=None):
+    """
+    Score every session in a log and write one CSV row per session
+    Returns totals: sessions, events, seconds, and accuracy if the log has labels
+    """
+    workers = workers or os.cpu_count()
+    binary = is_binary_log(source, log_format)
+    if binary:
+        blocks, task = read_binary_blocks(source, block_size or 200000), _score_binary_block
+    else:
+        blocks, task = read_json_blocks(source, block_size or 2000), _score_json_block
+    
+    totals = {'sessions': 0, 'events': 0, 'correct': 0, 'labelled': 0}
+    start = last_report = time.perf_counter()
+    
+    def collect(future, out):
+        rows, sessions, events, correct, labelled = future.result()
+        out.write(rows)
+        for key, value in zip(totals, (sessions, events, correct, labelled)):
+            totals[key] += value
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_file, tier_file)) as pool, \
+            open(output, 'w', encoding='utf-8') as out:
+        out.write(OUTPUT_HEADER)
+        in_flight = deque()
+        
+        for block in blocks:
+            # Results are written in input order as soon as the oldest block is done
+            if len(in_flight) >= 2 * workers:
+                collect(in_flight.popleft(), out)
+            in_flight.append(pool.submit(task, block))
+            
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                last_report = now
+                print(f"   ... {totals['sessions']:,} sessions "
+                      f"({totals['sessions'] / (now - start):,.0f}/s)")
+        
+        while in_flight:
+            collect(in_flight.popleft(), out)
+    
+    totals['seconds'] = time.perf_counter() - start
+    if totals['labelled']:
+        totals['accuracy'] = totals['correct'] / totals['labelled']
+    return totals
+
+def make_sample_log(path, sessions=10000, seed=42, log_format=None):
+    """Write a synthetic log of human- and bot-like sessions to try the tool on"""
+    rng = random.Random(seed)
+    binary = is_binary_log(path, log_format)
+    with open(path, 'wb' if binary else 'w') as f:
+        for handle in range(1, sessions + 1):
+            is_bot = rng.random() < 0.5
+            if is_bot:
+                # Few events, big jumps, short session
+                n_mouse, n_keys, jump, duration = rng.randint(2, 20), rng.randint(0, 50), 300, rng.uniform(0.5, 5)
+            else:
+                n_mouse, n_keys, jump, duration = rng.randint(20, 200), rng.randint(30, 150), 60, rng.uniform(10, 120)
+            
+            x, y = rng.uniform(0, 800), rng.uniform(0, 600)
+            events = []
+            for t in sorted(rng.uniform(0, duration) for _ in range(n_mouse)):
+                x += rng.gauss(0, jump)
+                y += rng.gauss(0, jump)
+                events.append({'type': 'mouse', 'x': round(x), 'y': round(y), 't': round(t, 3)})
+            for _ in range(n_keys):
+                events.append({'type': 'keyboard', 'key': 'a', 't': round(rng.uniform(0, duration), 3)})
+            events.sort(key=lambda e: e['t'])
+            
+            if binary:
+                f.write(b''.join(
+                    encode_track_event(handle, MOUSE_EVENT if e['type'] == 'mouse' else KEY_EVENT,
+                                       e.get('x', 0), e.get('y', 0), round(e['t'] * 1000))
+                    for e in events
+                ))
+            else:
+                f.write(json.dumps({'session_id': f'sample-{handle}', 'events': events,
+                                    'is_bot': int(is_bot)}) + '\n')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Score logged sessions in bulk')
+    parser.add_argument('log', help='session log (.jsonl, or binary /api/track records)')
+    parser.add_argument('-o', '--output', default='scores.csv', help='CSV file to write')
+    parser.add_argument('-f', '--format', choices=LOG_FORMATS, default=None,
+                        help='log format (default: jsonl for .jsonl/.json files, else binary)')
+    parser.add_argument('-m', '--model', default='bot_detector.pkl')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='processes (default: all CPUs)')
+    parser.add_argument('-b', '--block-size', type=int, default=None,
+                        help='sessions (JSONL) or records (binary) per task')
+    parser.add_argument('--make-sample', type=int, metavar='N',
+                        help='first write a synthetic log with N sessions to LOG')
+    args = parser.parse_args()
+    
+    if args.make_sample:
+        print(f"🧪 Writing {args.make_sample:,} sample sessions to {args.log}...")
+        make_sample_log(args.log, args.make_sample, log_format=args.format)
+    
+    print("=" * 60)
+    print("BULK SESSION SCORING")
+    print("=" * 60)
+    print(f"📂 {args.log} -> {args.output}")
+    
+    totals = score_log(args.log, args.output, model_file=args.model,
+                       workers=args.workers, block_size=args.block_size, log_format=args.format)
+    
+    print(f"\n✅ Scored {totals['sessions']:,} sessions ({totals['events']:,} events) "
+          f"in {totals['seconds']:.1f}s")
+    print(f"⚡ Throughput: {totals['sessions'] / totals['seconds']:,.0f} sessions/s, "
+          f"{totals['events'] / totals['seconds']:,.0f} events/s")
+    if 'accuracy' in totals:
+        print(f"🎯 Accuracy on labelled sessions: {totals['accuracy']*100:.2f}%")
@@ -1,227 +1,138 @@
 from model import BotDetector
+from challenge_token import ChallengeTokenSigner, InvalidToken
+from quiz_bank import QuizBank, DEFAULT_QUIZ_FILE
+from challenge_pool import ChallengePool
+from risk_tiers import RiskTierFile, RiskTierTable, DEFAULT_TIER_FILE
 import random
 import time
+import clock
 
 class AdvancedCaptchaSystem:
     """
     Advanced CAPTCHA system with multiple challenge types including quizzes
     """
     
-    def __init__(self, bot_detector):
+    def __init__(self, bot_detector, token_secret=None, token_ttl=300, quiz_file=DEFAULT_QUIZ_FILE,
+                 risk_tier_file=DEFAULT_TIER_FILE):
         self.detector = bot_detector
         
-        # Define risk thresholds
-        self.LOW_RISK = 0.3      # Below 30% = probably human
-        self.MEDIUM_RISK = 0.6   # 30-60% = suspicious
-        self.HIGH_RISK = 0.85    # Above 60% = likely bot
+        # Risk tiers (thresholds, actions, messages) come from risk_tiers.json
+        # and are reloaded automatically when the file changes
+        self.risk_tiers = RiskTierFile(risk_tier_file)
         
-        # Quiz database
-        self.quiz_questions = self._load_quiz_database()
+        # Quiz database (indexed by question id, shared by every instance)
+        self.quiz_bank = self._load_quiz_database(quiz_file)
+        
+        # Signed-token mode: challenges live in the token, not on the server
+        self.token_signer = ChallengeTokenSigner(token_secret, token_ttl) if token_secret else None
+        
+        # Optional pool of pre-generated challenges, see enable_pool()
+        self.challenge_pool = None
     
-    def _load_quiz_database(self):
-        """Load different types of quiz questions"""
-        return {
-            'logic': [
-                {
-                    'question': 'If all roses are flowers and some flowers fade quickly, can we conclude all roses fade quickly?',
-                    'options': ['Yes', 'No', 'Maybe', 'Cannot determine'],
-                    'correct': 'No',
-                    'explanation': 'This is a logical fallacy. We cannot conclude all roses fade quickly.'
-                },
-                {
-                    'question': 'What comes next in the sequence: 2, 4, 8, 16, ?',
-                    'options': ['24', '32', '20', '18'],
-                    'correct': '32',
-                    'explanation': 'Each number is doubled: 2×2=4, 4×2=8, 8×2=16, 16×2=32'
-                },
-                {
-                    'question': 'Which word does not belong: Car, Bus, Train, Table, Bicycle',
-                    'options': ['Car', 'Table', 'Train', 'Bicycle'],
-                    'correct': 'Table',
-                    'explanation': 'Table is not a vehicle.'
-                },
-                {
-                    'question': 'If 5 cats can catch 5 mice in 5 minutes, how many cats are needed to catch 100 mice in 100 minutes?',
-                    'options': ['100 cats', '20 cats', '5 cats', '10 cats'],
-                    'correct': '5 cats',
-                    'explanation': 'The rate remains constant. 5 cats can catch 5 mice in 5 minutes, so they can catch 100 mice in 100 minutes.'
-                }
-            ],
-            'common_sense': [
-                {
-                    'question': 'What do you use to cut paper?',
-                    'options': ['Hammer', 'Scissors', 'Spoon', 'Keyboard'],
-                    'correct': 'Scissors',
-                    'explanation': 'Scissors are the common tool for cutting paper.'
-                },
-                {
-                    'question': 'Where do fish live?',
-                    'options': ['Desert', 'Water', 'Mountains', 'Clouds'],
-                    'correct': 'Water',
-                    'explanation': 'Fish are aquatic animals and live in water.'
-                },
-                {
-                    'question': 'What season comes after winter?',
-                    'options': ['Summer', 'Fall', 'Spring', 'Monsoon'],
-                    'correct': 'Spring',
-                    'explanation': 'The seasonal cycle is Winter → Spring → Summer → Fall.'
-                },
-                {
-                    'question': 'Which is heavier: a kilogram of feathers or a kilogram of iron?',
-                    'options': ['Feathers', 'Iron', 'Both are equal', 'Cannot determine'],
-                    'correct': 'Both are equal',
-                    'explanation': 'Both weigh exactly 1 kilogram, regardless of material.'
-                },
-                {
-                    'question': 'How many days are in a week?',
-                    'options': ['5', '6', '7', '8'],
-                    'correct': '7',
-                    'explanation': 'A week has 7 days.'
-                }
-            ],
-            'math': [
-                {
-                    'question': 'What is 15 + 27?',
-                    'options': ['42', '41', '43', '40'],
-                    'correct': '42',
-                    'explanation': '15 + 27 = 42'
-                },
-                {
-                    'question': 'What is 12 × 8?',
-                    'options': ['84', '96', '88', '92'],
-                    'correct': '96',
-                    'explanation': '12 × 8 = 96'
-                },
-                {
-                    'question': 'What is 100 - 37?',
-                    'options': ['63', '73', '67', '57'],
-                    'correct': '63',
-                    'explanation': '100 - 37 = 63'
-                },
-                {
-                    'question': 'What is 50% of 80?',
-                    'options': ['30', '40', '45', '35'],
-                    'correct': '40',
-                    'explanation': '50% of 80 = 80 ÷ 2 = 40'
-                },
-                {
-                    'question': 'How many minutes are in 2.5 hours?',
-                    'options': ['120', '150', '180', '130'],
-                    'correct': '150',
-                    'explanation': '2.5 hours × 60 minutes = 150 minutes'
-                }
-            ],
-            'visual': [
-                {
-                    'question': 'How many letters are in the word "CAPTCHA"?',
-                    'options': ['6', '7', '8', '5'],
-                    'correct': '7',
-                    'explanation': 'C-A-P-T-C-H-A = 7 letters'
-                },
-                {
-                    'question': 'What color do you get when you mix blue and yellow?',
-                    'options': ['Purple', 'Green', 'Orange', 'Red'],
-                    'correct': 'Green',
-                    'explanation': 'Blue + Yellow = Green'
-                },
-                {
-                    'question': 'How many sides does a triangle have?',
-                    'options': ['2', '3', '4', '5'],
-                    'correct': '3',
-                    'explanation': 'A triangle has 3 sides by definition.'
-                },
-                {
-                    'question': 'What shape is a stop sign?',
-                    'options': ['Circle', 'Square', 'Octagon', 'Triangle'],
-                    'correct': 'Octagon',
-                    'explanation': 'Stop signs are octagonal (8-sided).'
-                }
-            ],
-            'pattern': [
-                {
-                    'question': 'Complete the pattern: A, C, E, G, ?',
-                    'options': ['H', 'I', 'J', 'K'],
-                    'correct': 'I',
-                    'explanation': 'Skip one letter each time: A, (B), C, (D), E, (F), G, (H), I'
-                },
-                {
-                    'question': 'What comes next: 🌙, ⭐, 🌙, ⭐, ?',
-                    'options': ['🌙', '⭐', '☀️', '🌍'],
-                    'correct': '🌙',
-                    'explanation': 'The pattern alternates between moon and star.'
-                },
-                {
-                    'question': 'Complete: 1, 1, 2, 3, 5, 8, ?',
-                    'options': ['11', '12', '13', '14'],
-                    'correct': '13',
-                    'explanation': 'Fibonacci sequence: each number is the sum of previous two (5+8=13).'
-                }
-            ]
-        }
+    def enable_pool(self, target_depth=200, low_watermark=50):
+        """
+        Pre-generate quiz challenges in a background thread (see challenge_pool.py)
+        """
+        self.challenge_pool = ChallengePool(
+            self._build_captcha, ['medium_quiz', 'hard_quiz'],
+            target_depth=target_depth, low_watermark=low_watermark
+        ).start()
+        return self.challenge_pool
+    
+    def _load_quiz_database(self, quiz_file):
+        """Load quiz questions from the data file (once per process)"""
+        return QuizBank.load(quiz_file)
     
-    def check_user(self, features):
+    def set_risk_tiers(self, tiers):
+        """
+        Swap in a new tier table at runtime (list of tier dicts like risk_tiers.json)
+        """
+        self.risk_tiers.table = RiskTierTable(tiers)
+    
+    def check_user(self, features, source_risk=0.0):
         """
         Analyze user behavior and decide what to do
+        source_risk = bot probability floor from signals outside the model
+        (the client's request rates, a replayed mouse trajectory)
         """
         # Get bot probability from ML model
-        bot_prob = self.detector.predict(features)
-        
-        # Decide action based on probability
-        if bot_prob < self.LOW_RISK:
-            return {
-                'action': 'allow',
-                'probability': float(bot_prob),
-                'message': 'Behavior looks human. Access granted! ✅',
-                'risk_level': 'low'
-            }
-        
-        elif bot_prob < self.MEDIUM_RISK:
-            return {
-                'action': 'simple_quiz',
-                'probability': float(bot_prob),
-                'message': 'Slightly suspicious. Please answer this simple question. 🤔',
-                'captcha_type': 'simple_quiz',
-                'risk_level': 'medium'
-            }
+        return self.check_probability(self.detector.predict(features), source_risk)
+    
+    def check_probability(self, bot_prob, source_risk=0.0):
+        """
+        Decide what to do for an already known bot probability
+        (e.g. a precomputed early verdict)
+        """
+        raised = source_risk > bot_prob
+        if raised:
+            bot_prob = source_risk
+        tier = self.risk_tiers.current(time.time()).lookup(bot_prob)
+        result = {
+            'action': tier['action'],
+            'probability': float(bot_prob),
+            'message': tier['message'],
+            'risk_level': tier['risk_level']
+        }
+        if tier.get('captcha_type'):
+            result['captcha_type'] = tier['captcha_type']
+        if raised:
+            result['source_risk'] = True
+        return result
+    
+    def check_users(self, features):
+        """
+        Batch version of check_user for many sessions at once
+        features: list of feature dicts, DataFrame or 2D array
+        Returns columns (numpy arrays): probability, risk_level, action, captcha_type
+        """
+        bot_probs = self.detector.predict_batch(features)
         
-        elif bot_prob < self.HIGH_RISK:
-            return {
-                'action': 'medium_quiz',
-                'probability': float(bot_prob),
-                'message': 'Suspicious activity detected. Complete this challenge. ⚠️',
-                'captcha_type': 'medium_quiz',
-                'risk_level': 'high'
-            }
+        # Same tiers as check_user, looked up for every row at once
+        table = self.risk_tiers.current(time.time())
+        tiers = table.lookup_many(bot_probs)
         
-        else:
-            return {
-                'action': 'hard_quiz',
-                'probability': float(bot_prob),
-                'message': 'High risk detected. Complete multiple challenges. 🚨',
-                'captcha_type': 'hard_quiz',
-                'risk_level': 'critical'
-            }
+        return {
+            'probability': bot_probs,
+            'risk_level': table.risk_levels[tiers],
+            'action': table.actions[tiers],
+            'captcha_type': table.captcha_types[tiers]
+        }
     
-    def generate_captcha(self, captcha_type):
+    def generate_captcha(self, captcha_type, session_id=''):
         """
         Generate CAPTCHA challenge based on type
+        In signed-token mode the answers are left out and a 'token' is added
+        """
+        pooled = self.challenge_pool.get(captcha_type) if self.challenge_pool else None
+        captcha, picked = pooled if pooled else self._build_captcha(captcha_type)
+        
+        if self.token_signer:
+            return self._sign_captcha(captcha, picked, session_id)
+        return captcha
+    
+    def _build_captcha(self, captcha_type):
+        """
+        Build a challenge; returns (captcha, picked question ids)
         """
         if captcha_type == 'simple_quiz':
             # Simple checkbox with timing
-            return {
+            captcha = {
                 'type': 'checkbox',
                 'instruction': 'Click the checkbox to verify you are human',
                 'difficulty': 'easy',
                 'time_limit': 30,
                 'requires_timing_analysis': True
             }
+            picked = []
         
         elif captcha_type == 'medium_quiz':
             # Single quiz question
             category = random.choice(['common_sense', 'math', 'visual'])
-            question = random.choice(self.quiz_questions[category])
+            qid = self.quiz_bank.random_id(category)
+            question = self.quiz_bank.get(qid)
+            picked = [qid]
             
-            return {
+            captcha = {
                 'type': 'quiz',
                 'difficulty': 'medium',
                 'category': category,
@@ -236,12 +147,15 @@ class AdvancedCaptchaSystem:
         elif captcha_type == 'hard_quiz':
             # Multiple quiz questions
             questions = []
+            picked = []
             
             # Mix different categories
             categories = random.sample(['logic', 'common_sense', 'math', 'pattern'], 3)
             
             for category in categories:
-                question = random.choice(self.quiz_questions[category])
+                qid = self.quiz_bank.random_id(category)
+                question = self.quiz_bank.get(qid)
+                picked.append(qid)
                 questions.append({
                     'category': category,
                     'question': question['question'],
@@ -250,7 +164,7 @@ class AdvancedCaptchaSystem:
                     'explanation': question['explanation']
                 })
             
-            return {
+            captcha = {
                 'type': 'multi_quiz',
                 'difficulty': 'hard',
                 'questions': questions,
@@ -262,12 +176,97 @@ class AdvancedCaptchaSystem:
         
         else:
             # Fallback to simple checkbox
-            return self.generate_captcha('simple_quiz')
+            return self._build_captcha('simple_quiz')
+        
+        return captcha, picked
+    
+    def _sign_captcha(self, captcha, picked, session_id):
+        """
+        Attach a signed token and strip everything the client must not see
+        """
+        captcha['token'] = self.token_signer.issue(captcha['type'], picked, bind=session_id)
+        
+        captcha.pop('correct_answer', None)
+        captcha.pop('explanation', None)
+        for question in captcha.get('questions', []):
+            question.pop('correct_answer', None)
+            question.pop('explanation', None)
+        return captcha
     
-    def verify_captcha_response(self, captcha, user_response):
+    def _captcha_from_token(self, captcha_type, question_ids):
+        """
+        Rebuild the gradable CAPTCHA (with answers) from token question ids
+        """
+        if captcha_type == 'checkbox':
+            return {'type': 'checkbox'}
+        
+        questions = []
+        for qid in question_ids:
+            if qid not in self.quiz_bank:
+                raise InvalidToken('Unknown question')
+            question = self.quiz_bank.get(qid)
+            questions.append({
+                'category': question['category'],
+                'question': question['question'],
+                'options': question['options'],
+                'correct_answer': question['correct'],
+                'explanation': question['explanation']
+            })
+        
+        if captcha_type == 'quiz':
+            return {'type': 'quiz', **questions[0]}
+        return {
+            'type': 'multi_quiz',
+            'questions': questions,
+            'passing_score': 2  # Same rule as generate_captcha('hard_quiz')
+        }
+    
+    def _verify_token(self, token, user_response, session_id):
+        """
+        Grade a response using only the signed token
+        """
+        try:
+            captcha_type, question_ids, issued_at, nonce = self.token_signer.decode(token, bind=session_id)
+            captcha = self._captcha_from_token(captcha_type, question_ids)
+        except InvalidToken as e:
+            return {'verified': False, 'reason': str(e)}
+        
+        if not isinstance(user_response, dict):
+            # Nothing to grade: leave the token unspent
+            return {'verified': False, 'reason': 'Missing response', 'type': captcha['type']}
+        
+        # Every graded attempt spends the token, so a failed attempt can't be
+        # retried with answers learned from it
+        if not self.token_signer.mark_used(nonce):
+            return {'verified': False, 'reason': 'Challenge already used', 'type': captcha['type']}
+        
+        # Calculate response time from the token if not provided
+        if 'response_time' not in user_response:
+            user_response['response_time'] = clock.now() - issued_at
+        
+        verification = self.verify_captcha_response(captcha, user_response)
+        verification['type'] = captcha['type']
+        
+        # No server-side state to retry against: don't hand out the answers
+        if not verification['verified']:
+            verification.pop('correct_answer', None)
+            verification.pop('explanation', None)
+            for result in verification.get('results', []):
+                result.pop('correct_answer', None)
+                result.pop('explanation', None)
+        
+        return verification
+    
+    def verify_captcha_response(self, captcha, user_response, session_id=''):
         """
         Check if user's CAPTCHA response is correct
+        captcha can also be a signed token string (signed-token mode)
         """
+        if isinstance(captcha, str):
+            if not self.token_signer:
+                return {'verified': False, 'reason': 'Signed tokens are not enabled'}
+            return self._verify_token(captcha, user_response, session_id)
+        
         if captcha['type'] == 'checkbox':
             # Check if they clicked and timing is human-like
             clicked = user_response.get('clicked', False)
@@ -351,21 +350,27 @@ class AdvancedCaptchaSystem:
     
     def get_statistics(self):
         """Get system statistics"""
-        total_questions = sum(len(questions) for questions in self.quiz_questions.values())
+        table = self.risk_tiers.table
         
-        return {
+        stats = {
             'thresholds': {
-                'low_risk': self.LOW_RISK,
-                'medium_risk': self.MEDIUM_RISK,
-                'high_risk': self.HIGH_RISK
+                f"{tier['risk_level']}_risk": tier['below'] for tier in table.tiers[:-1]
             },
+            'risk_tiers': table.get_statistics(),
+            'risk_tier_reloads': self.risk_tiers.reloads,
             'model_trained': self.detector.is_trained,
-            'quiz_database': {
-                'total_categories': len(self.quiz_questions),
-                'total_questions': total_questions,
-                'categories': list(self.quiz_questions.keys())
-            }
+            'signed_tokens': self.token_signer is not None,
+            'quiz_database': self.quiz_bank.statistics
         }
+        
+        if self.detector.cache is not None:
+            stats['score_cache'] = self.detector.cache.get_statistics()
+        if self.token_signer is not None:
+            stats['token_replay_set'] = self.token_signer.replay_set_size()
+        if self.challenge_pool is not None:
+            stats['challenge_pool'] = self.challenge_pool.get_statistics()
+        
+        return stats
 
 # Test the advanced CAPTCHA system
 if __name__ == "__main__":
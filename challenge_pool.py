@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+
+class ChallengePool:
+    """
+    Pre-generated CAPTCHA challenges, kept filled by a background thread
+    
+    get() pops a ready challenge in O(1). When a pool drops below
+    low_watermark the refill thread is woken up and tops it back up to
+    target_depth. If a pool is empty (e.g. during a burst of bot traffic)
+    get() returns None, the caller builds the challenge inline and the
+    exhaustion is counted. Pools and their counters change together under
+    one lock, so the counters stay exact under concurrent requests.
+    """
+    
+    def __init__(self, builder, captcha_types, target_depth=200, low_watermark=50):
+        self.builder = builder  # captcha_type -> (captcha, picked question ids)
+        self.target_depth = target_depth
+        self.low_watermark = low_watermark
+        
+        self.pools = {t: deque() for t in captcha_types}
+        self.stats = {t: {'served': 0, 'exhausted': 0, 'generated': 0, 'refills': 0}
+                      for t in captcha_types}
+        
+        self._lock = threading.Lock()  # guards pools and stats
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Fill every pool once, then keep refilling in the background"""
+        self._refill(force=True)
+        self._thread = threading.Thread(target=self._run, name='challenge-pool', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            # Also check every second in case a wakeup was missed
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            if not self._stopped.is_set():
+                self._refill()
+    
+    def _refill(self, force=False):
+        for captcha_type, pool in self.pools.items():
+            # Only refill pools that fell below the low watermark
+            if len(pool) >= self.low_watermark and not force:
+                continue
+            added = 0
+            while len(pool) < self.target_depth and not self._stopped.is_set():
+                challenge = self.builder(captcha_type)  # built outside the lock
+                with self._lock:
+                    pool.append(challenge)
+                    self.stats[captcha_type]['generated'] += 1
+                added += 1
+            if added:
+                with self._lock:
+                    self.stats[captcha_type]['refills'] += 1
+    
+    def get(self, captcha_type):
+        """A ready challenge, or None if this type isn't pooled or the pool is empty"""
+        pool = self.pools.get(captcha_type)
+        if pool is None:
+            return None
+        
+        with self._lock:
+            if not pool:
+                self.stats[captcha_type]['exhausted'] += 1
+                challenge = None
+            else:
+                challenge = pool.popleft()
+                self.stats[captcha_type]['served'] += 1
+            depth = len(pool)
+        
+        if depth < self.low_watermark:
+            self._wakeup.set()
+        return challenge
+    
+    def get_statistics(self):
+        with self._lock:
+            pools = {t: {'depth': len(pool), **self.stats[t]} for t, pool in self.pools.items()}
+        return {
+            'target_depth': self.target_depth,
+            'low_watermark': self.low_watermark,
+            'pools': pools
+        }
+
+# Quick demo: drain the pool faster than it refills
+if __name__ == "__main__":
+    from model import BotDetector
+    from captcha import AdvancedCaptchaSystem
+    
+    detector = BotDetector()
+    detector.load('bot_detector.pkl')
+    captcha_sys = AdvancedCaptchaSystem(detector)
+    captcha_sys.enable_pool(target_depth=100, low_watermark=25)
+    
+    start = time.perf_counter()
+    for _ in range(1000):
+        captcha_sys.generate_captcha('hard_quiz')
+    elapsed = time.perf_counter() - start
+    
+    print(f"\n⚡ 1000 hard challenges in {elapsed*1000:.1f} ms")
+    print(f"📊 Pool stats: {captcha_sys.challenge_pool.get_statistics()['pools']['hard_quiz']}")
@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import threading
+import clock
+
+# Token layout (before base64):
+#   version (1 byte), captcha type (1), issued at (float64 seconds, so
+#   response times aren't rounded up), nonce (8 bytes), question count (1),
+#   question ids (uint16 each), then a 16-byte HMAC-SHA256 tag over all of the above
+TOKEN_VERSION = 2
+HEADER = struct.Struct('>BBd8sB')
+TAG_SIZE = 16
+
+CAPTCHA_TYPES = ['checkbox', 'quiz', 'multi_quiz']
+
+class InvalidToken(Exception):
+    """Raised when a challenge token is forged, expired or already used"""
+    pass
+
+class ChallengeTokenSigner:
+    """
+    Issues and checks HMAC-signed challenge tokens
+    
+    The token carries everything needed to grade an answer (type, question
+    ids, issue time), so the server keeps no per-challenge state. The only
+    memory used is a replay set of nonces from tokens that were already
+    accepted, kept as two rotating generations of at most ttl seconds each.
+    """
+    
+    def __init__(self, secret, ttl=300):
+        if isinstance(secret, str):
+            secret = secret.encode()
+        self.secret = secret
+        self.ttl = ttl
+        
+        self._used = [set(), set()]  # [current, previous] generation
+        self._rotated_at = clock.now()
+        self._lock = threading.Lock()
+    
+    def _tag(self, body, bind):
+        return hmac.new(self.secret, body + bind.encode(), hashlib.sha256).digest()[:TAG_SIZE]
+    
+    def issue(self, captcha_type, question_ids=(), bind=''):
+        """
+        Create a token for a challenge
+        bind (e.g. the session id) must be given again when verifying
+        """
+        body = HEADER.pack(
+            TOKEN_VERSION, CAPTCHA_TYPES.index(captcha_type), clock.now(),
+            os.urandom(8), len(question_ids)
+        )
+        body += struct.pack(f'>{len(question_ids)}H', *question_ids)
+        return base64.urlsafe_b64encode(body + self._tag(body, bind)).rstrip(b'=').decode()
+    
+    def decode(self, token, bind=''):
+        """
+        Check the signature and expiry of a token
+        Returns (captcha_type, question_ids, issued_at, nonce)
+        """
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        except (ValueError, TypeError):
+            raise InvalidToken('Malformed token')
+        
+        if len(raw) < HEADER.size + TAG_SIZE:
+            raise InvalidToken('Malformed token')
+        
+        body, tag = raw[:-TAG_SIZE], raw[-TAG_SIZE:]
+        if not hmac.compare_digest(tag, self._tag(body, bind)):
+            raise InvalidToken('Invalid token signature')
+        
+        version, type_code, issued_at, nonce, count = HEADER.unpack_from(body)
+        if version != TOKEN_VERSION or type_code >= len(CAPTCHA_TYPES):
+            raise InvalidToken('Unsupported token')
+        if len(body) != HEADER.size + 2 * count:
+            raise InvalidToken('Malformed token')
+        
+        if clock.now() - issued_at > self.ttl:
+            raise InvalidToken('Challenge expired')
+        
+        question_ids = list(struct.unpack_from(f'>{count}H', body, HEADER.size))
+        return CAPTCHA_TYPES[type_code], question_ids, issued_at, nonce
+    
+    def _rotate(self):
+        # Anything older than two generations has expired anyway
+        now = clock.now()
+        if now - self._rotated_at >= self.ttl:
+            self._used = [set(), self._used[0]]
+            self._rotated_at = now
+    
+    def is_used(self, nonce):
+        with self._lock:
+            self._rotate()
+            return nonce in self._used[0] or nonce in self._used[1]
+    
+    def mark_used(self, nonce):
+        """Remember a nonce so its token can't be submitted again"""
+        with self._lock:
+            self._rotate()
+            if nonce in self._used[0] or nonce in self._used[1]:
+                return False
+            self._used[0].add(nonce)
+            return True
+    
+    def replay_set_size(self):
+        return len(self._used[0]) + len(self._used[1])
@@ -0,0 +1,26 @@
+import time
+
+# Where BehaviorTracker and the API read the current time from.
+# Normally the system clock; traffic replay (traffic.py) swaps in a
+# VirtualClock so recorded sessions get exactly the timings they had.
+_source = time.time
+
+def now():
+    return _source()
+
+def use(source=None):
+    """Read the time from source (a no-argument callable); None = system clock"""
+    global _source
+    _source = source or time.time
+
+class VirtualClock:
+    """A clock that only moves when it is set"""
+    
+    def __init__(self, start=0.0):
+        self.current = start
+    
+    def __call__(self):
+        return self.current
+    
+    def set(self, timestamp):
+        self.current = timestamp
@@ -0,0 +1,191 @@
+import json
+import os
+import numpy as np
+
+class CompactForest:
+    """
+    Small, read-only copy of a trained RandomForestClassifier
+    
+    All trees are flattened into shared arrays:
+    - internal nodes: feature (int8), threshold (float32), left/right child
+      (int16 when the forest is small enough, otherwise int32)
+    - leaves: only P(bot) as float32
+    A child index >= 0 points to an internal node, a negative one to leaf ~index.
+    Pruning never changes a prediction:
+    - a split that the splits above it already decide (same feature) is
+      replaced by the only child that can be reached
+    - a split whose two sides end in the same leaf or subtree is replaced by it
+    - equal leaves (after float32 rounding) and identical subtrees are stored
+      once and shared, also between trees
+    """
+    
+    def __init__(self, feature, threshold, left, right, leaf_value, roots, n_features,
+                 feature_names=None, feature_profile=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.n_features_in_ = n_features
+        self.classes_ = np.array([0, 1])
+        self.feature_names = feature_names
+        self.feature_profile = feature_profile  # see feature_drift.py
+    
+    @classmethod
+    def from_forest(cls, forest):
+        """Build a compact forest from a fitted RandomForestClassifier"""
+        feature, threshold, left, right, leaf_value, roots = [], [], [], [], [], []
+        leaf_codes = {}  # P(bot) -> leaf code
+        node_codes = {}  # (feature, threshold, left code, right code) -> node index
+        unbounded = (np.float32(-np.inf),) * forest.n_features_in_
+        
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            values = tree.value[:, 0, :]
+            values = values / values.sum(axis=1, keepdims=True)
+            
+            def add(node, low, high):
+                # Returns the code for node: >= 0 internal, < 0 leaf.
+                # Inputs reaching it have low[f] < x[f] <= high[f] for every feature f.
+                if tree.children_left[node] == -1:
+                    value = np.float32(values[node, 1])
+                    if value not in leaf_codes:
+                        leaf_value.append(value)
+                        leaf_codes[value] = ~(len(leaf_value) - 1)
+                    return leaf_codes[value]
+                
+                f = int(tree.feature[node])
+                # Round thresholds down so float32 inputs take the same branch
+                t = np.float32(tree.threshold[node])
+                if t > tree.threshold[node]:
+                    t = np.nextafter(t, np.float32(-np.inf))
+                if high[f] <= t:
+                    return add(tree.children_left[node], low, high)  # always goes left
+                if low[f] >= t:
+                    return add(tree.children_right[node], low, high)  # always goes right
+                
+                left_code = add(tree.children_left[node], low, high[:f] + (t,) + high[f + 1:])
+                right_code = add(tree.children_right[node], low[:f] + (t,) + low[f + 1:], high)
+                if left_code == right_code:
+                    return left_code  # both sides end the same way
+                
+                key = (f, t, left_code, right_code)
+                if key not in node_codes:
+                    node_codes[key] = len(feature)
+                    feature.append(f)
+                    threshold.append(t)
+                    left.append(left_code)
+                    right.append(right_code)
+                return node_codes[key]
+            
+            roots.append(add(0, unbounded, tuple(-x for x in unbounded)))
+        
+        # int16 indices are enough unless the forest is very large
+        limit = np.iinfo(np.int16).max
+        index_type = np.int16 if max(len(feature), len(leaf_value)) < limit else np.int32
+        
+        return cls(
+            feature=np.array(feature, dtype=np.int8),
+            threshold=np.array(threshold, dtype=np.float32),
+            left=np.array(left, dtype=index_type),
+            right=np.array(right, dtype=index_type),
+            leaf_value=np.array(leaf_value, dtype=np.float32),
+            roots=np.array(roots, dtype=index_type),
+            n_features=forest.n_features_in_
+        )
+    
+    def predict_proba(self, X):
+        """Same output as RandomForestClassifier.predict_proba"""
+        X = np.asarray(X, dtype=np.float32)
+        n_rows = X.shape[0]
+        
+        # Walk every (tree, row) pair down the forest at the same time
+        codes = np.repeat(self.roots.astype(np.int32), n_rows)
+        rows = np.tile(np.arange(n_rows), len(self.roots))
+        active = np.flatnonzero(codes >= 0)
+        while active.size:
+            node = codes[active]
+            go_left = X[rows[active], self.feature[node]] <= self.threshold[node]
+            codes[active] = np.where(go_left, self.left[node], self.right[node])
+            active = active[codes[active] >= 0]
+        
+        bot = self.leaf_value[~codes].astype(np.float64).reshape(len(self.roots), n_rows).mean(axis=0)
+        return np.column_stack([1 - bot, bot])
+    
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(int)
+    
+    @property
+    def n_nodes(self):
+        return len(self.feature) + len(self.leaf_value)
+    
+    def save(self, filename):
+        np.savez_compressed(
+            filename, feature=self.feature, threshold=self.threshold,
+            left=self.left, right=self.right, leaf_value=self.leaf_value,
+            roots=self.roots, n_features=self.n_features_in_,
+            feature_names=np.array(self.feature_names or []),
+            feature_profile=np.array(json.dumps(self.feature_profile))
+        )
+    
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        return cls(
+            data['feature'], data['threshold'], data['left'], data['right'],
+            data['leaf_value'], data['roots'], int(data['n_features']),
+            feature_names=data['feature_names'].tolist() or None,
+            feature_profile=json.loads(str(data['feature_profile'])) if 'feature_profile' in data else None
+        )
+
+def compact_model(model_file='bot_detector.pkl', output_file='bot_detector_compact.npz'):
+    """
+    Compact a saved BotDetector model and save it next to the original
+    Returns the detector and the compact forest
+    """
+    from model import BotDetector
+    
+    detector = BotDetector()
+    detector.load(model_file)
+    forest = CompactForest.from_forest(detector.model)
+    forest.feature_names = detector.feature_names
+    forest.feature_profile = detector.feature_profile
+    forest.save(output_file)
+    return detector, forest
+
+# Compact bot_detector.pkl and check it gives the same answers
+if __name__ == "__main__":
+    import pandas as pd
+    
+    print("=" * 60)
+    print("COMPACTING BOT DETECTION MODEL")
+    print("=" * 60)
+    
+    detector, forest = compact_model('bot_detector.pkl', 'bot_detector_compact.npz')
+    
+    original_nodes = sum(e.tree_.node_count for e in detector.model.estimators_)
+    print(f"\n🌲 Nodes: {original_nodes} → {forest.n_nodes} "
+          f"({len(forest.feature)} splits, {len(forest.leaf_value)} leaves)")
+    print(f"   Index type: {forest.left.dtype}")
+    
+    original_size = os.path.getsize('bot_detector.pkl')
+    compact_size = os.path.getsize('bot_detector_compact.npz')
+    print(f"\n💾 bot_detector.pkl: {original_size / 1024:.1f} KB")
+    print(f"   bot_detector_compact.npz: {compact_size / 1024:.1f} KB")
+    print(f"   ✓ {original_size / compact_size:.1f}x smaller")
+    
+    # Verify on the training data plus random points across the feature ranges
+    df = pd.read_csv('training_data.csv')
+    X = df[detector.feature_names].to_numpy()
+    rng = np.random.default_rng(0)
+    X = np.vstack([X, rng.uniform(X.min(axis=0), X.max(axis=0), size=(5000, X.shape[1]))])
+    
+    expected = detector.model.predict_proba(pd.DataFrame(X, columns=detector.feature_names))
+    actual = forest.predict_proba(X)
+    
+    mismatches = int(((expected[:, 1] > 0.5) != (actual[:, 1] > 0.5)).sum())
+    print(f"\n🧪 Checked {len(X)} samples")
+    print(f"   Prediction mismatches: {mismatches}")
+    print(f"   Max probability difference: {np.abs(expected - actual).max():.2e}")
+    print("   ✓ Predictions match!" if mismatches == 0 else "   ❌ Predictions differ!")
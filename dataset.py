@@ -0,0 +1,105 @@
+import json
+import os
+import numpy as np
+
+# Files inside a binary dataset directory
+MANIFEST_FILE = 'manifest.json'
+FEATURES_FILE = 'features.npy'
+LABELS_FILE = 'labels.npy'
+
+DATASET_FORMAT = 'captcha-columnar-v1'
+
+class BinaryDataset:
+    """
+    Memory-mapped training dataset written by save_dataset()
+    
+    Features are stored as one float32 matrix in column-major (Fortran)
+    order, so every feature column is contiguous on disk. Rows are already
+    shuffled and stratified, with the training rows first, so the
+    train/test split is just a slice at split_index (no copying).
+    """
+    
+    def __init__(self, path, mmap=True):
+        self.path = path
+        
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        
+        if self.manifest.get('format') != DATASET_FORMAT:
+            raise ValueError(f"Unknown dataset format in {path}: {self.manifest.get('format')}")
+        
+        mmap_mode = 'r' if mmap else None
+        self.X = np.load(os.path.join(path, FEATURES_FILE), mmap_mode=mmap_mode)
+        self.y = np.load(os.path.join(path, LABELS_FILE), mmap_mode=mmap_mode)
+        
+        self.feature_names = self.manifest['feature_names']
+        self.label = self.manifest['label']
+        self.split_index = self.manifest['split_index']
+    
+    def __len__(self):
+        return len(self.y)
+    
+    def train_split(self):
+        """Training rows (views into the memory map)"""
+        return self.X[:self.split_index], self.y[:self.split_index]
+    
+    def test_split(self):
+        """Held-out rows (views into the memory map)"""
+        return self.X[self.split_index:], self.y[self.split_index:]
+
+def is_binary_dataset(path):
+    """Check whether path points to a directory written by save_dataset()"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+def save_dataset(data, path, label='is_bot', test_size=0.2, random_state=42):
+    """
+    Write samples as a binary columnar dataset
+    
+    data can be a list of dicts (like generate_data.py produces) or a
+    DataFrame. The stratified train/test split is done here, once, and
+    rows are written training-first so that BinaryDataset can split by
+    index later.
+    """
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+    
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    feature_names = [c for c in df.columns if c != label]
+    y = df[label].to_numpy(dtype=np.int8)
+    
+    # Stratified split on row indices only, then reorder rows train-first
+    train_idx, test_idx = train_test_split(
+        np.arange(len(df)), test_size=test_size, random_state=random_state, stratify=y
+    )
+    order = np.concatenate([train_idx, test_idx])
+    
+    X = np.asfortranarray(df[feature_names].to_numpy(dtype=np.float32)[order])
+    
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, FEATURES_FILE), X)
+    np.save(os.path.join(path, LABELS_FILE), y[order])
+    
+    manifest = {
+        'format': DATASET_FORMAT,
+        'feature_names': feature_names,
+        'label': label,
+        'dtype': 'float32',
+        'n_samples': int(len(df)),
+        'split_index': int(len(train_idx)),
+        'test_size': test_size,
+        'random_state': random_state
+    }
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    
+    return manifest
+
+# Convert the CSV dataset into the binary format
+if __name__ == "__main__":
+    import pandas as pd
+    
+    print("📂 Converting training_data.csv to binary format...")
+    manifest = save_dataset(pd.read_csv('training_data.csv'), 'training_data_bin')
+    print(f"   ✓ Wrote {manifest['n_samples']} samples to training_data_bin/")
+    print(f"   - Training rows: {manifest['split_index']}")
+    print(f"   - Features: {manifest['feature_names']}")
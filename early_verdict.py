@@ -0,0 +1,188 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+from model import BotDetector, load_detector
+
+PREFIX_MODEL_FILE = 'bot_detector_prefix.pkl'
+PREFIX_DATA_FILE = 'training_prefixes.csv'
+
+# Features that grow with the session; rates (speeds) stay the same in a prefix
+GROWING_FEATURES = ['mouse_count', 'keystroke_count', 'session_duration']
+
+def make_prefix_dataset(df, prefixes_per_session=4, min_fraction=0.05, random_state=42):
+    """
+    Add partial-session rows to a training DataFrame
+    Each session is cut at random points: counts and duration shrink with
+    the fraction of the session seen, speeds don't. Full sessions are kept.
+    Every row gets the number of the session it came from in a 'session'
+    column, so BotDetector.train keeps a session's cuts on one side of its
+    train/test split.
+    """
+    rng = np.random.default_rng(random_state)
+    df = df.assign(session=np.arange(len(df)))
+    prefixes = df.loc[df.index.repeat(prefixes_per_session)].reset_index(drop=True)
+    fraction = rng.uniform(min_fraction, 1.0, len(prefixes))
+    
+    for column in GROWING_FEATURES:
+        scaled = prefixes[column] * fraction
+        prefixes[column] = scaled if column == 'session_duration' else np.round(scaled).astype(int)
+    
+    return pd.concat([df, prefixes], ignore_index=True)
+
+def train_prefix_model(csv_file='training_data.csv', model_file=PREFIX_MODEL_FILE):
+    """
+    Train a BotDetector on session prefixes so it can score sessions early
+    """
+    df = make_prefix_dataset(pd.read_csv(csv_file))
+    df.to_csv(PREFIX_DATA_FILE, index=False)
+    print(f"✂️  Wrote {len(df)} full + partial sessions to {PREFIX_DATA_FILE}")
+    
+    detector = BotDetector()
+    detector.train(PREFIX_DATA_FILE)
+    detector.save(model_file)
+    return detector
+
+class _SessionScores:
+    __slots__ = ('scored_events', 'scores', 'verdict')
+    
+    def __init__(self, window):
+        self.scored_events = 0
+        self.scores = deque(maxlen=window)
+        self.verdict = None
+
+class EarlyVerdictScorer:
+    """
+    Anytime scoring of live sessions
+    
+    A background thread rescores every session that got new events since
+    its last score, all in one batched model call. Once a session's last
+    `window` scores agree to within `tolerance` and are confidently human
+    (<= human_below) or bot (>= bot_above), it has a verdict, and
+    /api/verify can answer without running the model. A later score that
+    breaks the pattern takes the verdict away again.
+    """
+    
+    def __init__(self, detector, sessions, interval=0.5, min_events=20, min_new_events=5,
+                 window=3, tolerance=0.05, human_below=0.2, bot_above=0.8):
+        self.detector = detector
+        self.sessions = sessions  # session_id -> BehaviorTracker (shared with the API)
+        self.interval = interval
+        self.min_events = min_events
+        self.min_new_events = min_new_events
+        self.window = window
+        self.tolerance = tolerance
+        self.human_below = human_below
+        self.bot_above = bot_above
+        
+        self.states = {}
+        self.stats = {'passes': 0, 'rescored': 0, 'served': 0, 'missed': 0}
+        
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='early-verdicts', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stopped.set()
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.score_pending()
+            except Exception as e:
+                # Never let one bad pass kill the thread
+                print(f"⚠️  Early verdict pass failed: {e}")
+    
+    def score_pending(self):
+        """Rescore sessions with enough new events; returns how many were scored"""
+        self.stats['passes'] += 1
+        
+        # Forget sessions the API has cleaned up
+        for session_id in [sid for sid in self.states if sid not in self.sessions]:
+            del self.states[session_id]
+        
+        pending = []
+        for session_id, tracker in list(self.sessions.items()):
+            events = tracker.event_count()
+            if events < self.min_events:
+                continue
+            state = self.states.get(session_id)
+            if state is None:
+                state = self.states[session_id] = _SessionScores(self.window)
+            if events - state.scored_events >= self.min_new_events:
+                pending.append((state, events, tracker.get_features()))
+        
+        if not pending:
+            return 0
+        
+        scores = self.detector.predict_batch([features for _, _, features in pending])
+        for (state, events, _), score in zip(pending, scores):
+            state.scored_events = events
+            state.scores.append(float(score))
+            state.verdict = self._decide(state.scores, events)
+        
+        self.stats['rescored'] += len(pending)
+        return len(pending)
+    
+    def _decide(self, scores, events):
+        if len(scores) < self.window or max(scores) - min(scores) > self.tolerance:
+            return None
+        probability = sum(scores) / len(scores)
+        if probability <= self.human_below:
+            label = 'human'
+        elif probability >= self.bot_above:
+            label = 'bot'
+        else:
+            return None
+        return {'verdict': label, 'probability': probability, 'events': events, 'decided_at': time.time()}
+    
+    def verdict(self, session_id):
+        """The precomputed verdict for a session, or None if it isn't settled yet"""
+        state = self.states.get(session_id)
+        verdict = state.verdict if state else None
+        self.stats['served' if verdict else 'missed'] += 1
+        return verdict
+    
+    def get_statistics(self):
+        decided = [s.verdict['verdict'] for s in list(self.states.values()) if s.verdict]
+        lookups = self.stats['served'] + self.stats['missed']
+        return {
+            **self.stats,
+            'tracked_sessions': len(self.states),
+            'decided_human': decided.count('human'),
+            'decided_bot': decided.count('bot'),
+            'precomputed_rate': self.stats['served'] / lookups if lookups else 0.0
+        }
+
+def load_prefix_detector(fallback):
+    """The prefix model if it has been trained, else the full-session model"""
+    if os.path.exists(PREFIX_MODEL_FILE):
+        return load_detector(PREFIX_MODEL_FILE)
+    print(f"   ℹ️  No {PREFIX_MODEL_FILE} yet (run: python early_verdict.py); early verdicts use the main model")
+    return fallback
+
+# Train the prefix model: python early_verdict.py [training_data.csv]
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else 'training_data.csv'
+    detector = train_prefix_model(source)
+    
+    # How early can it call typical sessions?
+    print("\n⏱️  Bot probability as a session goes on:")
+    human = {'mouse_count': 150, 'avg_mouse_speed': 300, 'keystroke_count': 80,
+             'typing_speed': 5, 'session_duration': 45}
+    bot = {'mouse_count': 5, 'avg_mouse_speed': 1500, 'keystroke_count': 300,
+           'typing_speed': 25, 'session_duration': 2}
+    
+    def cut(features, fraction):
+        return {k: v * fraction if k in GROWING_FEATURES else v for k, v in features.items()}
+    
+    for fraction in [0.1, 0.25, 0.5, 1.0]:
+        print(f"   {fraction*100:3.0f}% seen: human {detector.predict(cut(human, fraction))*100:5.1f}%   "
+              f"bot {detector.predict(cut(bot, fraction))*100:5.1f}%")
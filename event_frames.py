@@ -0,0 +1,64 @@
+import struct
+import numpy as np
+
+# Binary WebSocket frames, one event per frame:
+#   mouse:    type 0 (1 byte), x (int16), y (int16)  -> 5 bytes
+#   keyboard: type 1 (1 byte), key as UTF-8          -> 2+ bytes
+# A JSON text frame like {"type": "mouse", "x": 1, "y": 2} is also accepted.
+MOUSE_EVENT = 0
+KEY_EVENT = 1
+MOUSE_FRAME = struct.Struct('>Bhh')
+MAX_KEY_BYTES = 32
+
+# Binary POST /api/track bodies (Content-Type: application/x-captcha-events)
+# are any number of fixed 13-byte records:
+#   session handle (uint32, from /api/session/start), event type (1 byte),
+#   x (int16), y (int16), milliseconds since the session started (uint32)
+TRACK_CONTENT_TYPE = 'application/x-captcha-events'
+TRACK_RECORD = struct.Struct('>IBhhI')
+TRACK_RECORD_DTYPE = np.dtype([
+    ('handle', '>u4'), ('type', 'u1'), ('x', '>i2'), ('y', '>i2'), ('ms', '>u4')
+])
+
+def _clamp(value):
+    return max(-32768, min(32767, int(value)))
+
+def encode_mouse(x, y):
+    return MOUSE_FRAME.pack(MOUSE_EVENT, _clamp(x), _clamp(y))
+
+def encode_key(key):
+    return bytes([KEY_EVENT]) + key.encode('utf-8')[:MAX_KEY_BYTES]
+
+def apply_frame(tracker, frame):
+    """
+    Decode one binary frame and record it on a BehaviorTracker
+    Raises ValueError for frames it doesn't understand
+    """
+    if not frame:
+        raise ValueError('Empty frame')
+    
+    if frame[0] == MOUSE_EVENT:
+        if len(frame) != MOUSE_FRAME.size:
+            raise ValueError('Bad mouse frame')
+        _, x, y = MOUSE_FRAME.unpack(frame)
+        tracker.add_mouse_movement(x, y)
+    elif frame[0] == KEY_EVENT:
+        if len(frame) > 1 + MAX_KEY_BYTES:
+            raise ValueError('Bad keyboard frame')
+        tracker.add_keystroke(frame[1:].decode('utf-8', errors='replace'))
+    else:
+        raise ValueError(f'Unknown event type: {frame[0]}')
+
+def encode_track_event(handle, event_type, x=0, y=0, ms=0):
+    return TRACK_RECORD.pack(handle, event_type, _clamp(x), _clamp(y), int(ms))
+
+def decode_track_records(body):
+    """
+    View a binary /api/track body as a numpy record array (no copy)
+    Records with an unknown event type are dropped
+    """
+    if len(body) % TRACK_RECORD.size:
+        raise ValueError(f'Body is not a whole number of {TRACK_RECORD.size}-byte records')
+    records = np.frombuffer(body, dtype=TRACK_RECORD_DTYPE)
+    known = (records['type'] == MOUSE_EVENT) | (records['type'] == KEY_EVENT)
+    return records if known.all() else records[known]
@@ -0,0 +1,188 @@
+import threading
+import numpy as np
+import clock
+
+# Training-time profile: each feature is split into BINS bins at its
+# training quantiles, so every bin holds about the same share of the
+# training rows (bins whose edges coincide, e.g. many zeros, are merged)
+BINS = 20
+QUANTILE_LEVELS = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+# Population Stability Index rule of thumb: under 0.1 stable, 0.1-0.25 a
+# moderate shift, 0.25 and above drifted enough to retrain
+PSI_SHIFT = 0.1
+PSI_DRIFT = 0.25
+MIN_LIVE_SAMPLES = 200  # fewer live samples than this give noisy scores
+
+def feature_profile(X, feature_names, bins=BINS):
+    """
+    Per-feature histogram and quantiles of the training rows X (n x features),
+    as plain lists so it can be pickled or saved as JSON with the model
+    """
+    X = np.asarray(X, dtype=np.float64)
+    levels = np.linspace(0, 1, bins + 1)[1:-1]
+    edges, proportions = [], []
+    for column in X.T:
+        feature_edges = np.unique(np.quantile(column, levels))
+        counts = np.bincount(np.searchsorted(feature_edges, column, side='right'),
+                             minlength=len(feature_edges) + 1)
+        edges.append(feature_edges.tolist())
+        proportions.append((counts / len(column)).tolist())
+    
+    return {
+        'feature_names': list(feature_names),
+        'rows': len(X),
+        'edges': edges,
+        'proportions': proportions,
+        'quantile_levels': QUANTILE_LEVELS,
+        'quantiles': np.quantile(X, QUANTILE_LEVELS, axis=0).T.tolist(),
+        'mean': X.mean(axis=0).tolist()
+    }
+
+def profile_csv(csv_file, feature_names):
+    """Profile of a training CSV, for models saved without one"""
+    data = np.genfromtxt(csv_file, delimiter=',', names=True)
+    return feature_profile(np.column_stack([data[name] for name in feature_names]), feature_names)
+
+class ReservoirSample:
+    """
+    Uniform random sample of at most `size` rows from a stream of chunks,
+    for profiling datasets too big to hold in memory (train_streaming)
+    """
+    
+    def __init__(self, size=100000, seed=0):
+        self.size = size
+        self.rows = None
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+    
+    def add(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.rows is None:
+            self.rows = np.empty((0, X.shape[1]))
+        
+        # Fill up first, then row number t replaces a random row with probability size / t
+        free = max(0, min(self.size - len(self.rows), len(X)))
+        self.rows = np.concatenate([self.rows, X[:free]])
+        self.seen += free
+        rest = X[free:]
+        if len(rest):
+            t = self.seen + np.arange(1, len(rest) + 1)
+            keep = self._rng.random(len(rest)) < self.size / t
+            self.rows[self._rng.integers(0, self.size, keep.sum())] = rest[keep]
+            self.seen += len(rest)
+
+class DriftMonitor:
+    """
+    Streaming histograms of live feature vectors, compared against the
+    training profile stored with the model
+    
+    Live counts use the training bin edges and live in a ring of n_buckets
+    time buckets covering the last `window` seconds, keyed by absolute
+    bucket number like source_rates.py (so counts also expire when the
+    clock jumps backwards), and observing a vector is one fixed-size
+    update. Scores per feature:
+    - psi: Population Stability Index between live and training bin shares
+    - ks: largest gap between the live and training CDFs at the bin edges
+      (a binned Kolmogorov-Smirnov statistic)
+    """
+    
+    def __init__(self, profile, window=3600.0, n_buckets=12):
+        self.profile = profile
+        self.feature_names = profile['feature_names']
+        self.window = window
+        self.n_buckets = n_buckets
+        self.bucket_seconds = window / n_buckets
+        
+        # Pad edges with +inf so all features share one array (extra bins stay empty)
+        n_edges = max(len(edges) for edges in profile['edges'])
+        self.edges = np.full((len(self.feature_names), n_edges), np.inf)
+        self.expected = np.zeros((len(self.feature_names), n_edges + 1))
+        for i, (edges, proportions) in enumerate(zip(profile['edges'], profile['proportions'])):
+            self.edges[i, :len(edges)] = edges
+            self.expected[i, :len(proportions)] = proportions
+        
+        self.counts = np.zeros((n_buckets, len(self.feature_names), n_edges + 1), dtype=np.int64)
+        self.sums = np.zeros((n_buckets, len(self.feature_names)))
+        self._rows = np.arange(len(self.feature_names))
+        self._bucket_ids = np.full(n_buckets, -1, dtype=np.int64)  # bucket number held by each slot
+        self.observed = 0
+        self._lock = threading.Lock()
+    
+    def _slot(self, bucket):
+        """Ring slot for a bucket number, zeroed if it held another bucket"""
+        slot = bucket % self.n_buckets
+        if self._bucket_ids[slot] != bucket:
+            self.counts[slot] = 0
+            self.sums[slot] = 0
+            self._bucket_ids[slot] = bucket
+        return slot
+    
+    def _in_window(self, bucket):
+        """Slots holding one of the n_buckets buckets up to and including `bucket`"""
+        return (self._bucket_ids > bucket - self.n_buckets) & (self._bucket_ids <= bucket)
+    
+    def observe(self, features):
+        """Add one live feature dict (as returned by BehaviorTracker.get_features)"""
+        values = np.array([features[name] for name in self.feature_names], dtype=np.float64)
+        bins = (values[:, None] >= self.edges).sum(axis=1)
+        bucket = int(clock.now() // self.bucket_seconds)
+        with self._lock:
+            slot = self._slot(bucket)
+            self.counts[slot, self._rows, bins] += 1
+            self.sums[slot] += values
+            self.observed += 1
+    
+    def scores(self):
+        """Drift scores per feature over the window, plus an overall status"""
+        bucket = int(clock.now() // self.bucket_seconds)
+        with self._lock:
+            live = self._in_window(bucket)
+            counts = self.counts[live].sum(axis=0)
+            sums = self.sums[live].sum(axis=0)
+        n = int(counts[0].sum())
+        
+        report = {
+            'live_samples': n,
+            'training_rows': self.profile['rows'],
+            'window_seconds': self.window,
+            'features': {}
+        }
+        if n < MIN_LIVE_SAMPLES:
+            report['status'] = 'not enough data'
+            return report
+        
+        actual = counts / n
+        # Floor empty bins so the logarithm stays finite
+        a = np.maximum(actual, 1e-4)
+        e = np.maximum(self.expected, 1e-4)
+        used = (actual > 0) | (self.expected > 0)
+        psi = np.where(used, (a - e) * np.log(a / e), 0.0).sum(axis=1)
+        ks = np.abs(np.cumsum(actual, axis=1) - np.cumsum(self.expected, axis=1)).max(axis=1)
+        
+        levels = self.profile['quantile_levels']
+        for i, name in enumerate(self.feature_names):
+            status = 'drift' if psi[i] >= PSI_DRIFT else 'shift' if psi[i] >= PSI_SHIFT else 'stable'
+            report['features'][name] = {
+                'psi': round(float(psi[i]), 4),
+                'ks': round(float(ks[i]), 4),
+                'status': status,
+                'training_mean': self.profile['mean'][i],
+                'live_mean': float(sums[i] / n),
+                'training_quantiles': {f'p{round(level * 100)}': value
+                                       for level, value in zip(levels, self.profile['quantiles'][i])}
+            }
+        
+        drifted = [name for name, scores in report['features'].items() if scores['status'] == 'drift']
+        report['max_psi'] = round(float(psi.max()), 4)
+        report['drifted_features'] = drifted
+        report['status'] = 'drift' if drifted else 'shift' if psi.max() >= PSI_SHIFT else 'stable'
+        report['retrain_suggested'] = bool(drifted)
+        return report
+    
+    def get_statistics(self):
+        return {
+            'observed': self.observed,
+            'window_seconds': self.window,
+            'memory_bytes': self.counts.nbytes + self.sums.nbytes
+        }
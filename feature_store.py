@@ -0,0 +1,229 @@
+import atexit
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import numpy as np
+import clock
+from tracker import FEATURE_NAMES
+
+# Feature store layout: a directory with a manifest and numbered segments
+#   segment: header (magic "CFSG", version uint16, record size uint16,
+#            created at float64) then fixed-width records, appended only
+#   record:  decided at (float64), session id hash (uint64),
+#            the 5 features (float32), bot probability (float32, NaN if unknown),
+#            label (int8: 0 human, 1 bot), label source (uint8), 6 bytes padding
+MANIFEST_FILE = 'feature_store.json'
+STORE_FORMAT = 'captcha-feature-store-v1'
+MAGIC = b'CFSG'
+VERSION = 1
+HEADER = struct.Struct('<4sHHd')
+RECORD_STRUCT = struct.Struct(f'<dQ{len(FEATURE_NAMES)}ffbB6x')
+RECORD = np.dtype([
+    ('time', '<f8'),
+    ('session', '<u8'),
+    ('features', '<f4', (len(FEATURE_NAMES),)),
+    ('probability', '<f4'),
+    ('label', 'i1'),
+    ('source', 'u1'),
+    ('padding', 'V6')
+])
+
+# Where a label came from, and the label it gives
+# ('allow' is the model's own verdict, so training on it reinforces the model)
+LABEL_SOURCES = {'allow': 0, 'quiz_passed': 1, 'quiz_failed': 2}
+SOURCE_LABELS = {'allow': 0, 'quiz_passed': 0, 'quiz_failed': 1}
+
+def session_hash(session_id):
+    return int.from_bytes(hashlib.blake2b(session_id.encode(), digest_size=8).digest(), 'little')
+
+class FeatureStore:
+    """
+    Append-only log of decided sessions' feature vectors and labels, for
+    retraining on production traffic
+    
+    append() only buffers the record; a background thread writes the
+    buffer every flush_interval seconds and fsyncs it. Records go to
+    numbered segment files; a segment is closed once it reaches
+    segment_bytes and a new one is started (also on every restart, so a
+    segment torn by a crash is never appended to).
+    """
+    
+    def __init__(self, path='feature_store', segment_bytes=64 * 1024 * 1024, flush_interval=1.0):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get('format') != STORE_FORMAT or manifest.get('feature_names') != list(FEATURE_NAMES):
+                raise ValueError(f'{path} is a feature store with a different layout')
+        else:
+            with open(manifest_path, 'w') as f:
+                json.dump({'format': STORE_FORMAT, 'feature_names': list(FEATURE_NAMES),
+                           'record_bytes': RECORD.itemsize, 'label_sources': LABEL_SOURCES,
+                           'source_labels': SOURCE_LABELS}, f, indent=2)
+        
+        self.stats = {'appended': 0, 'written': 0, 'fsyncs': 0, 'rotations': 0}
+        self._file = None
+        self._segment_size = 0
+        self._buffer = []
+        self._lock = threading.Lock()  # guards _buffer
+        self._write_lock = threading.Lock()  # one flush at a time
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Flush on a timer in the background, and once more at exit"""
+        self._thread = threading.Thread(target=self._run, name='feature-store', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+    
+    def stop(self):
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self.flush()
+            with self._write_lock:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+    
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"⚠️  Feature store write failed: {e}")
+    
+    def append(self, session_id, features, source, probability=None):
+        """Buffer one decided session (features as returned by get_features)"""
+        record = RECORD_STRUCT.pack(clock.now(), session_hash(session_id),
+                                    *[features[name] for name in FEATURE_NAMES],
+                                    math.nan if probability is None else probability,
+                                    SOURCE_LABELS[source], LABEL_SOURCES[source])
+        with self._lock:
+            self._buffer.append(record)
+            self.stats['appended'] += 1
+    
+    def flush(self):
+        """Write and fsync buffered records"""
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        
+        with self._write_lock:
+            if self._file is None or self._segment_size + len(records) * RECORD.itemsize > self.segment_bytes:
+                self._rotate()
+            data = b''.join(records)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._segment_size += len(data)
+            self.stats['written'] += len(records)
+            self.stats['fsyncs'] += 1
+    
+    def _rotate(self):
+        """Close the current segment and create the next one"""
+        if self._file:
+            self._file.close()
+            self.stats['rotations'] += 1
+        number = len(segment_files(self.path)) + 1
+        while True:
+            try:
+                # 'x' fails if another process took this number first
+                self._file = open(os.path.join(self.path, f'segment-{number:06d}.bin'), 'xb')
+                break
+            except FileExistsError:
+                number += 1
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, clock.now()))
+        self._segment_size = HEADER.size
+    
+    def get_statistics(self):
+        return {**self.stats, 'path': self.path, 'segments': len(segment_files(self.path)),
+                'buffered': len(self._buffer)}
+
+def is_feature_store(path):
+    """Check whether path points to a directory written by FeatureStore"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+def segment_files(path):
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if name.startswith('segment-') and name.endswith('.bin'))
+
+def read_segment(filename):
+    """Memory-map a segment's records (a torn last record is left out)"""
+    if os.path.getsize(filename) < HEADER.size:
+        return np.empty(0, dtype=RECORD)  # just created, header not written yet
+    with open(filename, 'rb') as f:
+        magic, version, record_bytes, _ = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or record_bytes != RECORD.itemsize:
+        raise ValueError(f'{filename} is not a feature store segment')
+    
+    n = (os.path.getsize(filename) - HEADER.size) // RECORD.itemsize
+    if n == 0:
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(filename, dtype=RECORD, mode='r', offset=HEADER.size, shape=(n,))
+
+def load_feature_store(path, label_sources=None, since=None, until=None, latest_only=True):
+    """
+    Training rows from a feature store: (X, y, sources)
+    
+    label_sources: only records labelled this way (names from
+    LABEL_SOURCES, default all); since/until: time range (Unix seconds).
+    Segments entirely outside the range are skipped without reading
+    their records. With latest_only, a session that was recorded more than
+    once (a failed quiz, then a passed one) keeps its last record.
+    """
+    codes = [LABEL_SOURCES[name] for name in (label_sources or LABEL_SOURCES)]
+    selected = []
+    for filename in segment_files(path):
+        records = read_segment(filename)
+        if len(records) == 0:
+            continue
+        # Records are appended in time order, so a segment spans first..last
+        if (since is not None and records[-1]['time'] < since) or (until is not None and records[0]['time'] >= until):
+            continue
+        
+        keep = np.isin(records['source'], codes)
+        if since is not None:
+            keep &= records['time'] >= since
+        if until is not None:
+            keep &= records['time'] < until
+        selected.append(records[keep])  # copies only the kept records
+    
+    records = np.concatenate(selected) if selected else np.empty(0, dtype=RECORD)
+    if latest_only and len(records):
+        # np.unique keeps the first occurrence, so look from the end
+        _, last = np.unique(records['session'][::-1], return_index=True)
+        records = records[np.sort(len(records) - 1 - last)]
+    
+    names = {code: name for name, code in LABEL_SOURCES.items()}
+    sources = [names[code] for code in records['source']]
+    return records['features'].astype(np.float32), records['label'].astype(np.int8), sources
+
+# Summarize a feature store: python feature_store.py [path]
+if __name__ == "__main__":
+    import sys
+    from collections import Counter
+    
+    path = sys.argv[1] if len(sys.argv) > 1 else 'feature_store'
+    print(f"📂 Feature store {path}")
+    files = segment_files(path)
+    for filename in files:
+        records = read_segment(filename)
+        span = f"{records[0]['time']:.0f} - {records[-1]['time']:.0f}" if len(records) else "empty"
+        print(f"   {os.path.basename(filename)}: {len(records)} records ({span})")
+    
+    X, y, sources = load_feature_store(path)
+    print(f"\n📊 {len(y)} sessions in {len(files)} segments")
+    print(f"   - Humans: {(y == 0).sum()}")
+    print(f"   - Bots: {(y == 1).sum()}")
+    for source, count in Counter(sources).most_common():
+        print(f"   - {source}: {count}")
@@ -1,6 +1,7 @@
 import pandas as pd
 import random
 import time
+from dataset import save_dataset
 
 def generate_human_data(num_samples=100):
     """
@@ -99,7 +100,11 @@ if __name__ == "__main__":
     df = pd.DataFrame(all_data)
     df.to_csv('training_data.csv', index=False)
     
+    # Also save the memory-mappable binary version for fast training
+    save_dataset(df, 'training_data_bin')
+    
     print(f"\n✅ SUCCESS! Created training_data.csv with {len(all_data)} samples")
+    print("   ✓ Binary copy written to training_data_bin/")
     print(f"   - Humans: {len(human_data)} samples")
     print(f"   - Bots: {len(bot_data)} samples")
     
@@ -1,59 +1,136 @@
 import pandas as pd
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import GroupShuffleSplit, train_test_split
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 import joblib
 import numpy as np
+from dataset import BinaryDataset, is_binary_dataset
+from compact import CompactForest
+from score_cache import ScoreCache
+from feature_drift import feature_profile, ReservoirSample
+from feature_store import is_feature_store, load_feature_store
+from tracker import FEATURE_NAMES
 
 class BotDetector:
     """
     Machine Learning model to detect bots
     """
     
-    def __init__(self):
-        # Random Forest is good for this task
+    def __init__(self, n_estimators=100, max_depth=10, min_samples_leaf=1):
+        # Random Forest is good for this task (tune.py searches these parameters)
         self.model = RandomForestClassifier(
-            n_estimators=100,  # Use 100 decision trees
-            max_depth=10,
+            n_estimators=n_estimators,  # Number of decision trees
+            max_depth=max_depth,
+            min_samples_leaf=min_samples_leaf,
             random_state=42
         )
         self.is_trained = False
         self.feature_names = None
+        self.cache = None  # Optional ScoreCache, see enable_cache()
+        self.fast_model = None  # Optional small forest, see enable_fast_path()
+        self.feature_profile = None  # Training feature distribution, see feature_drift.py
     
-    def train(self, csv_file='training_data.csv'):
+    def enable_cache(self, max_size=10000, resolution=None, check_drift=False):
+        """
+        Cache scores of near-identical feature vectors (see score_cache.py)
+        """
+        self.cache = ScoreCache(max_size=max_size, resolution=resolution, check_drift=check_drift)
+        return self.cache
+    
+    def enable_fast_path(self, n_trees=10):
+        """
+        Keep a compact forest of the first n_trees trees for predict_fast()
+        (a cheaper, slightly less accurate score for when the API is overloaded)
+        """
+        if isinstance(self.model, CompactForest):
+            forest = self.model
+            self.fast_model = CompactForest(forest.feature, forest.threshold, forest.left, forest.right,
+                                            forest.leaf_value, forest.roots[:n_trees], forest.n_features_in_,
+                                            feature_names=forest.feature_names)
+        else:
+            subset = clone(self.model)
+            subset.estimators_ = self.model.estimators_[:n_trees]
+            subset.n_features_in_ = self.model.n_features_in_
+            self.fast_model = CompactForest.from_forest(subset)
+        return self.fast_model
+    
+    def train(self, csv_file='training_data.csv', label_sources=None, since=None, until=None):
         """
         Train the model using our dataset
+        csv_file can also be a binary dataset directory (see dataset.py) or
+        a feature store of production sessions (see feature_store.py); for a
+        feature store, label_sources and since/until select which records
         """
         print("=" * 60)
         print("TRAINING BOT DETECTION MODEL")
         print("=" * 60)
         
         print("\n📂 Loading training data from", csv_file)
-        df = pd.read_csv(csv_file)
-        print(f"   ✓ Loaded {len(df)} samples")
+        if is_binary_dataset(csv_file):
+            # Binary dataset: memory-map it and split at the stored index
+            dataset = BinaryDataset(csv_file)
+            print(f"   ✓ Memory-mapped {len(dataset)} samples")
+            
+            self.feature_names = dataset.feature_names
+            X_train, y_train = dataset.train_split()
+            X_test, y_test = dataset.test_split()
+        elif is_feature_store(csv_file):
+            # Production sessions: memory-map the segments, keep the selected records
+            X, y, sources = load_feature_store(csv_file, label_sources, since, until)
+            print(f"   ✓ Loaded {len(y)} sessions from the feature store")
+            for source in sorted(set(sources)):
+                print(f"   - {source}: {sources.count(source)}")
+            if len(np.unique(y)) < 2:
+                raise Exception("The selected records don't contain both humans and bots - cannot train.")
+            
+            self.feature_names = list(FEATURE_NAMES)
+            X = pd.DataFrame(X, columns=self.feature_names)
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, test_size=0.2, random_state=42, stratify=y
+            )
+        else:
+            df = pd.read_csv(csv_file)
+            print(f"   ✓ Loaded {len(df)} samples")
+            
+            # Rows cut from the same session (see early_verdict.py) share a
+            # 'session' number and must not end up on both sides of the split
+            groups = df.pop('session') if 'session' in df.columns else None
+            
+            # Separate features (X) and labels (y)
+            X = df.drop('is_bot', axis=1)  # Features
+            y = df['is_bot']  # Labels (0=human, 1=bot)
+            
+            self.feature_names = X.columns.tolist()
+            
+            # Split into training (80%) and testing (20%)
+            if groups is not None:
+                splitter = GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
+                train_index, test_index = next(splitter.split(X, y, groups))
+                X_train, X_test = X.iloc[train_index], X.iloc[test_index]
+                y_train, y_test = y.iloc[train_index], y.iloc[test_index]
+                print(f"   ✓ Split by session ({groups.nunique()} sessions)")
+            else:
+                X_train, X_test, y_train, y_test = train_test_split(
+                    X, y, test_size=0.2, random_state=42, stratify=y
+                )
         
-        # Separate features (X) and labels (y)
-        X = df.drop('is_bot', axis=1)  # Features
-        y = df['is_bot']  # Labels (0=human, 1=bot)
-        
-        self.feature_names = X.columns.tolist()
         print(f"\n📊 Features used for training: {self.feature_names}")
         
-        # Split into training (80%) and testing (20%)
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, stratify=y
-        )
-        
         print(f"\n📚 Training set: {len(X_train)} samples")
         print(f"🧪 Testing set: {len(X_test)} samples")
-        print(f"   - Humans in training: {sum(y_train == 0)}")
-        print(f"   - Bots in training: {sum(y_train == 1)}")
+        print(f"   - Humans in training: {(y_train == 0).sum()}")
+        print(f"   - Bots in training: {(y_train == 1).sum()}")
         
         # Train the model
         print("\n🔄 Training Random Forest model...")
         self.model.fit(X_train, y_train)
         print("   ✓ Training complete!")
         
+        # Keep the training distribution so live traffic can be compared to it
+        self.feature_profile = feature_profile(X_train, self.feature_names)
+        print(f"   ✓ Feature profile stored ({self.feature_profile['rows']} rows)")
+        
         # Test accuracy
         print("\n📈 Evaluating model performance...")
         train_predictions = self.model.predict(X_train)
@@ -89,6 +166,121 @@ class BotDetector:
         self.is_trained = True
         return self
     
+    def _iter_chunks(self, source, chunk_size, test_size, random_state):
+        """
+        Yield (X, y, is_test) chunks from a CSV file or binary dataset
+        is_test marks the held-out rows and is the same on every pass
+        """
+        if is_binary_dataset(source):
+            dataset = BinaryDataset(source)
+            self.feature_names = dataset.feature_names
+            
+            # Binary datasets already store the held-out rows at the end
+            for start in range(0, len(dataset), chunk_size):
+                end = min(start + chunk_size, len(dataset))
+                is_test = np.arange(start, end) >= dataset.split_index
+                yield dataset.X[start:end], dataset.y[start:end], is_test
+        else:
+            for i, df in enumerate(pd.read_csv(source, chunksize=chunk_size)):
+                X = df.drop('is_bot', axis=1)
+                self.feature_names = X.columns.tolist()
+                
+                # Seeded per chunk so the held-out rows never change between passes
+                rng = np.random.default_rng([random_state, i])
+                is_test = rng.random(len(df)) < test_size
+                yield X.to_numpy(dtype=np.float32), df['is_bot'].to_numpy(), is_test
+    
+    def train_streaming(self, source='training_data.csv', chunk_size=100000,
+                        trees_per_chunk=10, test_size=0.2, random_state=42):
+        """
+        Train on a dataset too big for memory, one chunk at a time
+        Each chunk adds trees_per_chunk new trees to the forest (warm_start),
+        and the test set is evaluated in a second streaming pass
+        """
+        print("=" * 60)
+        print("STREAMING TRAINING (OUT-OF-CORE)")
+        print("=" * 60)
+        
+        print(f"\n📂 Streaming training data from {source} ({chunk_size} rows per chunk)")
+        # Start from an empty forest with the same settings
+        self.model = clone(self.model).set_params(warm_start=True, n_estimators=0)
+        
+        # Pass 1: grow the forest chunk by chunk
+        trained_rows = 0
+        chunks = 0
+        # Chunks with only one class can't grow trees: their rows wait for a chunk
+        # with the other class, kept as a uniform sample of at most chunk_size rows
+        waiting, waiting_label = None, None
+        sample = ReservoirSample(seed=random_state)  # for the feature profile
+        for X, y, is_test in self._iter_chunks(source, chunk_size, test_size, random_state):
+            X_train, y_train = X[~is_test], y[~is_test]
+            if len(y_train) == 0:
+                continue
+            sample.add(X_train)
+            
+            classes = np.unique(y_train)
+            if len(classes) < 2 and (waiting is None or classes[0] == waiting_label):
+                if waiting is None:
+                    waiting, waiting_label = ReservoirSample(size=chunk_size, seed=random_state), classes[0]
+                waiting.add(X_train)
+                continue
+            if waiting is not None:
+                if waiting.seen > len(waiting.rows):
+                    print(f"   ⚠️  {waiting.seen} rows of one class in a row: "
+                          f"using a sample of {len(waiting.rows)}")
+                X_train = np.concatenate([waiting.rows.astype(np.float32), X_train])
+                y_train = np.concatenate([np.full(len(waiting.rows), waiting_label, dtype=y_train.dtype), y_train])
+                waiting = None
+            
+            self.model.set_params(n_estimators=self.model.n_estimators + trees_per_chunk)
+            self.model.fit(X_train, y_train)
+            
+            trained_rows += len(y_train)
+            chunks += 1
+            print(f"   ✓ Chunk {chunks}: {len(y_train)} rows, {self.model.n_estimators} trees so far")
+        
+        if chunks == 0:
+            raise Exception("No chunk contained both humans and bots - cannot train.")
+        if waiting is not None:
+            print(f"   ⚠️  Skipped last {waiting.seen} rows (only one class)")
+        
+        self.model.set_params(warm_start=False)
+        print(f"\n📚 Trained on {trained_rows} rows in {chunks} chunks")
+        self.feature_profile = feature_profile(sample.rows, self.feature_names)
+        print(f"   ✓ Feature profile stored (sampled {len(sample.rows)} of {sample.seen} rows)")
+        
+        # Pass 2: streaming confusion matrix over the held-out rows
+        print("\n📈 Evaluating model performance (streaming)...")
+        cm = np.zeros((2, 2), dtype=np.int64)
+        for X, y, is_test in self._iter_chunks(source, chunk_size, test_size, random_state):
+            if not is_test.any():
+                continue
+            predictions = self.model.predict(X[is_test])
+            np.add.at(cm, (y[is_test].astype(np.int64), predictions.astype(np.int64)), 1)
+        
+        tested_rows = cm.sum()
+        test_accuracy = (cm[0][0] + cm[1][1]) / tested_rows if tested_rows else 0.0
+        
+        print(f"\n✅ RESULTS:")
+        print(f"🧪 Testing set: {tested_rows} samples")
+        print(f"   Testing Accuracy: {test_accuracy*100:.2f}%")
+        
+        print("\n📊 Confusion Matrix (Test Set):")
+        print(f"   True Humans correctly identified: {cm[0][0]}")
+        print(f"   Humans misclassified as Bots: {cm[0][1]}")
+        print(f"   Bots misclassified as Humans: {cm[1][0]}")
+        print(f"   True Bots correctly identified: {cm[1][1]}")
+        
+        for label, name in [(0, 'Human'), (1, 'Bot')]:
+            predicted = cm[0][label] + cm[1][label]
+            actual = cm[label].sum()
+            precision = cm[label][label] / predicted if predicted else 0.0
+            recall = cm[label][label] / actual if actual else 0.0
+            print(f"   {name}: precision {precision:.2f}, recall {recall:.2f}")
+        
+        self.is_trained = True
+        return self
+    
     def predict(self, features):
         """
         Predict if given features are from a bot
@@ -97,6 +289,24 @@ class BotDetector:
         if not self.is_trained:
             raise Exception("Model not trained yet! Run .train() first.")
         
+        # Only single feature dicts go through the cache
+        if self.cache is None or not isinstance(features, dict):
+            return self._predict_exact(features)
+        
+        key = self.cache.make_key(features, self.feature_names)
+        bot_probability = self.cache.get(key)
+        if bot_probability is None:
+            bot_probability = self._predict_exact(features)
+            self.cache.put(key, bot_probability)
+        elif self.cache.check_drift:
+            self.cache.record_drift(bot_probability, self._predict_exact(features))
+        
+        return bot_probability
+    
+    def _predict_exact(self, features):
+        """
+        Run the model (no cache)
+        """
         # Convert dict to DataFrame if needed
         if isinstance(features, dict):
             features = pd.DataFrame([features])
@@ -104,11 +314,51 @@ class BotDetector:
         # Ensure correct feature order
         features = features[self.feature_names]
         
+        # Models trained from a binary dataset were fitted without column names
+        if not hasattr(self.model, 'feature_names_in_'):
+            features = features.to_numpy()
+        
         # Get probability of being a bot
         bot_probability = self.model.predict_proba(features)[0][1]
         
         return bot_probability
     
+    def predict_fast(self, features):
+        """
+        Bot probability of one feature dict from the fast path
+        (falls back to predict() if enable_fast_path() wasn't called)
+        """
+        if self.fast_model is None:
+            return self.predict(features)
+        row = [[features[name] for name in self.feature_names]]
+        return float(self.fast_model.predict_proba(row)[0, 1])
+    
+    def predict_batch(self, features):
+        """
+        Predict many samples with a single model call
+        features: list of feature dicts, DataFrame, or 2D array in feature_names order
+        Returns: numpy array of bot probabilities
+        """
+        if not self.is_trained:
+            raise Exception("Model not trained yet! Run .train() first.")
+        
+        if isinstance(features, pd.DataFrame):
+            matrix = features[self.feature_names].to_numpy(dtype=np.float64)
+        elif len(features) and isinstance(features[0], dict):
+            matrix = np.array([[f[name] for name in self.feature_names] for f in features],
+                              dtype=np.float64)
+        else:
+            matrix = np.asarray(features, dtype=np.float64).reshape(-1, len(self.feature_names))
+        
+        if len(matrix) == 0:
+            return np.empty(0)
+        
+        # Models trained from a CSV expect column names
+        if hasattr(self.model, 'feature_names_in_'):
+            matrix = pd.DataFrame(matrix, columns=self.feature_names)
+        
+        return self.model.predict_proba(matrix)[:, 1]
+    
     def predict_with_details(self, features):
         """
         Get detailed prediction with explanation
@@ -135,7 +385,8 @@ class BotDetector:
         model_data = {
             'model': self.model,
             'feature_names': self.feature_names,
-            'is_trained': self.is_trained
+            'is_trained': self.is_trained,
+            'feature_profile': self.feature_profile
         }
         
         joblib.dump(model_data, filename)
@@ -144,16 +395,45 @@ class BotDetector:
     def load(self, filename='bot_detector.pkl'):
         """
         Load a trained model from a file
+        .npz files are compact forests made by compact.py
         """
         print(f"📂 Loading model from {filename}...")
+        if filename.endswith('.npz'):
+            # Compacted forest written by compact.py
+            self.model = CompactForest.load(filename)
+            self.feature_names = self.model.feature_names
+            self.feature_profile = self.model.feature_profile
+            self.is_trained = True
+            if self.cache is not None:
+                self.cache.clear()
+            print(f"   ✓ Compact model loaded successfully!")
+            return
+        
         model_data = joblib.load(filename)
         
         self.model = model_data['model']
         self.feature_names = model_data['feature_names']
         self.is_trained = model_data['is_trained']
+        self.feature_profile = model_data.get('feature_profile')  # None for models saved before profiles
+        
+        # Cached scores belong to the old model
+        if self.cache is not None:
+            self.cache.clear()
         
         print(f"   ✓ Model loaded successfully!")
 
+# Loaded models by file name, so each file is loaded once per process
+# (prefork.py loads them before forking and the workers share those copies)
+_loaded = {}
+
+def load_detector(filename='bot_detector.pkl'):
+    """A BotDetector loaded from filename, reused if this process already loaded it"""
+    if filename not in _loaded:
+        detector = BotDetector()
+        detector.load(filename)
+        _loaded[filename] = detector
+    return _loaded[filename]
+
 # Train and test the model
 if __name__ == "__main__":
     # Create and train detector
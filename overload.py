@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import deque
+import clock
+
+NORMAL = 'normal'
+DEGRADED = 'degraded'  # thin mouse events, cheap verify scoring
+SHEDDING = 'shedding'  # ...and turn away new sessions
+MODES = [NORMAL, DEGRADED, SHEDDING]
+
+class OverloadController:
+    """
+    Watches requests in flight and request latency, and steps the API
+    through NORMAL -> DEGRADED -> SHEDDING under pressure
+    
+    Pressure is in_flight >= max_in_flight or latency (an exponentially
+    weighted moving average) >= latency_high; twice either moves straight
+    to SHEDDING. The API steps back down one mode at a time once in_flight
+    and latency have stayed under half their limits for recover_after
+    seconds. Every mode change is kept in `changes`.
+    """
+    
+    def __init__(self, max_in_flight=32, latency_high=0.25, recover_after=5.0,
+                 smoothing=0.2, retry_after=5):
+        self.max_in_flight = max_in_flight
+        self.latency_high = latency_high
+        self.recover_after = recover_after
+        self.smoothing = smoothing
+        self.retry_after = retry_after  # seconds, for the Retry-After header
+        
+        self.mode = NORMAL
+        self.in_flight = 0
+        self.latency = 0.0
+        self.forced = None  # a fixed mode (traffic replay), bypassing the measurements
+        self.changes = deque(maxlen=100)
+        self.stats = {'thinned_events': 0, 'cheap_verifies': 0, 'rejected_sessions': 0}
+        
+        self._calm_since = None
+        self._lock = threading.Lock()
+    
+    @property
+    def degraded(self):
+        return (self.forced or self.mode) != NORMAL
+    
+    @property
+    def shedding(self):
+        return (self.forced or self.mode) == SHEDDING
+    
+    def force(self, mode):
+        """Pin the mode (None goes back to measuring)"""
+        self.forced = mode
+    
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+    
+    def request_finished(self, seconds, counted=True):
+        """
+        counted=False for requests that were turned away, so their quick
+        responses don't make the API look healthy
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if counted:
+                self.latency += self.smoothing * (seconds - self.latency)
+            self._update()
+    
+    def _update(self):
+        in_flight, latency = self.in_flight, self.latency
+        level = MODES.index(self.mode)
+        
+        target = level
+        if in_flight < self.max_in_flight / 2 and latency < self.latency_high / 2:
+            # Calm: step down one mode every recover_after seconds
+            now = time.monotonic()
+            if self._calm_since is None:
+                self._calm_since = now
+            elif level and now - self._calm_since >= self.recover_after:
+                target = level - 1
+                self._calm_since = now
+        else:
+            self._calm_since = None
+            if in_flight >= 2 * self.max_in_flight or latency >= 2 * self.latency_high:
+                target = 2
+            elif in_flight >= self.max_in_flight or latency >= self.latency_high:
+                target = max(level, 1)
+        
+        if target != level:
+            self._change(MODES[target], in_flight, latency)
+    
+    def _change(self, mode, in_flight, latency):
+        self.changes.append({'at': clock.now(), 'from': self.mode, 'to': mode,
+                             'in_flight': in_flight, 'latency_ms': round(latency * 1000, 1)})
+        icon = '🟢' if mode == NORMAL else '🟠' if mode == DEGRADED else '🔴'
+        print(f"{icon} Overload: {self.mode} -> {mode} "
+              f"({in_flight} in flight, {latency * 1000:.0f} ms average latency)")
+        self.mode = mode
+    
+    def get_statistics(self):
+        return {
+            **self.stats,
+            'mode': self.forced or self.mode,
+            'in_flight': self.in_flight,
+            'latency_ms': round(self.latency * 1000, 1),
+            'max_in_flight': self.max_in_flight,
+            'latency_high_ms': self.latency_high * 1000,
+            'mode_changes': list(self.changes)
+        }
@@ -0,0 +1,275 @@
+import argparse
+import gc
+import http.client
+import os
+import secrets
+import signal
+import socket
+import sys
+import threading
+import time
+from flask import Response, g, request
+from werkzeug.serving import make_server
+from event_frames import TRACK_CONTENT_TYPE
+from model import load_detector
+
+# Models the parent loads before forking (bot_detector_prefix.pkl only if it exists)
+MODEL_FILES = ['bot_detector.pkl', 'bot_detector_prefix.pkl']
+
+# Requests for another worker's session are passed on to it over a local port
+# (marked with api.FORWARDED_HEADER)
+FORWARD_TIMEOUT = 10.0
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'host'}
+
+def memory_usage(pid):
+    """
+    Memory of a process in KB from /proc/<pid>/smaps_rollup (Linux):
+    rss, pss (shared pages split between the processes sharing them),
+    shared and private. None if it can't be read.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in f if line.rstrip().endswith('kB')}
+    except (OSError, ValueError, IndexError):
+        return None
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+class PreforkServer:
+    """
+    Runs the Flask API in `workers` forked processes sharing one listening socket
+    
+    The parent loads the models and warms them up, then freezes the garbage
+    collector (gc.freeze) before forking, so the model's memory is shared
+    copy-on-write: collections in the workers never write to those objects'
+    pages. The parent only supervises: a worker that exits is restarted
+    (after a growing delay if it keeps crashing right away) and memory per
+    worker is printed every report_interval seconds.
+    
+    Sessions live in the worker that started them. Each worker also listens
+    on its own local port, and a request for another worker's session is
+    passed on to that worker (see api.session_owner).
+    """
+    
+    def __init__(self, workers=4, host='0.0.0.0', port=5000, report_interval=60.0, min_uptime=5.0):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.report_interval = report_interval
+        self.min_uptime = min_uptime  # a worker dying sooner than this counts as crashing
+        
+        self.pids = {}  # pid -> worker number
+        self.started_at = {}  # worker number -> start time
+        self.restart_delay = {}  # worker number -> seconds to wait before the next restart
+        self.restart_at = {}  # worker number -> when to restart it
+        self.restarts = 0
+        self._stopping = False
+        # Proves a request was forwarded by a worker (see api.FORWARD_SECRET)
+        self.forward_secret = secrets.token_hex(16)
+    
+    def preload(self):
+        """Load and warm up the models, then freeze them for sharing"""
+        gc.disable()  # no collections while loading; they would only churn the new objects
+        for filename in MODEL_FILES:
+            if os.path.exists(filename):
+                detector = load_detector(filename)
+                # First predictions import sklearn's lazy modules and build caches
+                detector.predict({name: 1.0 for name in detector.feature_names})
+                detector.predict_batch([{name: 1.0 for name in detector.feature_names}] * 8)
+        gc.freeze()  # everything so far moves to a generation the collector never visits
+        gc.enable()
+    
+    def start(self):
+        self.public = socket.create_server((self.host, self.port), backlog=1024)
+        # One local socket per worker, bound here so restarts keep the same port
+        self.private = [socket.create_server(('127.0.0.1', 0), backlog=256) for _ in range(self.workers)]
+        self.private_ports = [s.getsockname()[1] for s in self.private]
+        
+        print(f"📦 Preloading models in the parent (pid {os.getpid()})...")
+        self.preload()
+        print(f"   ✓ {gc.get_freeze_count()} objects frozen for sharing")
+        
+        for worker in range(self.workers):
+            self._spawn(worker)
+        return self
+    
+    def _spawn(self, worker):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self._run_worker(worker)
+            except SystemExit:
+                code = 0
+            except BaseException as e:
+                print(f"❌ Worker {worker} failed: {e!r}")
+            finally:
+                sys.stdout.flush()
+                os._exit(code)  # never fall back into the parent's loop
+        self.pids[pid] = worker
+        self.started_at[worker] = time.monotonic()
+        print(f"👷 Worker {worker} started (pid {pid})")
+    
+    def _run_worker(self, worker):
+        # The parent handles Ctrl+C and tells the workers to stop with SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        
+        os.environ['CAPTCHA_WORKER'] = str(worker)
+        os.environ['CAPTCHA_WORKERS'] = str(self.workers)
+        os.environ['CAPTCHA_FORWARD_SECRET'] = self.forward_secret
+        import api  # only now: its background threads must start in the worker
+        
+        api.enable_snapshots()
+        ports = self.private_ports
+        
+        def forward(owner):
+            headers = {name: value for name, value in request.headers.items() if name.lower() not in HOP_HEADERS}
+            headers[api.FORWARDED_HEADER] = str(worker)
+            headers[api.FORWARD_SECRET_HEADER] = api.FORWARD_SECRET
+            headers[api.FORWARDED_FOR_HEADER] = g.client_ip  # keep the original client's counts
+            connection = http.client.HTTPConnection('127.0.0.1', ports[owner], timeout=FORWARD_TIMEOUT)
+            try:
+                connection.request(request.method, request.full_path, body=request.get_data(), headers=headers)
+                response = connection.getresponse()
+                return Response(response.read(), response.status,
+                                [(k, v) for k, v in response.getheaders() if k.lower() not in HOP_HEADERS])
+            except OSError:
+                return api.json_response({'error': 'Worker unavailable, please try again shortly',
+                                          'retry_after': 1}, 503)
+            finally:
+                connection.close()
+        
+        @api.app.before_request
+        def route_to_owner():
+            if g.forwarded_by is not None or not request.path.startswith('/api/'):
+                return None
+            if request.mimetype == TRACK_CONTENT_TYPE:
+                owner = api.session_owner(body=request.get_data())
+            else:
+                owner = api.session_owner(request.get_json(silent=True))
+            if owner is None or owner == worker:
+                return None
+            g.forwarded = True
+            return forward(owner)
+        
+        local = make_server('127.0.0.1', ports[worker], api.app, threaded=True, fd=self.private[worker].fileno())
+        threading.Thread(target=local.serve_forever, name='local-requests', daemon=True).start()
+        server = make_server(self.host, self.port, api.app, threaded=True, fd=self.public.fileno())
+        try:
+            server.serve_forever()
+        finally:
+            # Workers leave with os._exit, which skips atexit: save here
+            api.snapshotter.stop()
+            for saver in (api.feature_store, api.recorder):
+                if saver:
+                    saver.stop()
+    
+    def supervise(self):
+        """Restart workers that exit, and report memory, until SIGINT/SIGTERM"""
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        next_report = time.monotonic() + min(self.report_interval, 10.0)  # first report once workers are up
+        
+        while not self._stopping:
+            self._reap()
+            now = time.monotonic()
+            for worker, when in list(self.restart_at.items()):
+                if now >= when:
+                    del self.restart_at[worker]
+                    self.restarts += 1
+                    self._spawn(worker)
+            if now >= next_report:
+                self.report_memory()
+                next_report = now + self.report_interval
+            time.sleep(0.2)
+        self.stop()
+    
+    def _request_stop(self, *_):
+        self._stopping = True
+    
+    def _reap(self):
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.pids.pop(pid, None)
+            if worker is None or self._stopping:
+                continue
+            
+            if os.WIFSIGNALED(status):
+                how = f"killed by signal {os.WTERMSIG(status)}"
+            else:
+                how = f"exited with code {os.WEXITSTATUS(status)}"
+            # Crashing straight after starting: back off (1s, 2s, 4s... up to 30s)
+            if time.monotonic() - self.started_at[worker] < self.min_uptime:
+                delay = min(self.restart_delay.get(worker, 0.5) * 2, 30.0)
+            else:
+                delay = 0.0
+            self.restart_delay[worker] = delay or 0.5
+            self.restart_at[worker] = time.monotonic() + delay
+            print(f"💥 Worker {worker} (pid {pid}) {how}; restarting in {delay:.0f}s")
+    
+    def stop(self, timeout=10.0):
+        """SIGTERM every worker (they save their sessions), then SIGKILL stragglers"""
+        print(f"\n🛑 Stopping {len(self.pids)} workers...")
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        while self.pids and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.pids.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.pids:
+            os.kill(pid, signal.SIGKILL)
+    
+    def memory_report(self):
+        """Memory (KB) per worker, and for the parent"""
+        report = [{'worker': worker, 'pid': pid, **(memory_usage(pid) or {})}
+                  for pid, worker in sorted(self.pids.items(), key=lambda item: item[1])]
+        report.append({'worker': 'parent', 'pid': os.getpid(), **(memory_usage(os.getpid()) or {})})
+        return report
+    
+    def report_memory(self):
+        print(f"\n📊 Memory per worker (MB) - {self.restarts} restarts so far")
+        for row in self.memory_report():
+            if 'rss' not in row:
+                print(f"   {row['worker']:>6} (pid {row['pid']}): not available on this platform")
+                continue
+            print(f"   {row['worker']:>6} (pid {row['pid']}): RSS {row['rss'] / 1024:6.1f}  "
+                  f"PSS {row['pss'] / 1024:6.1f}  shared {row['shared'] / 1024:6.1f}  "
+                  f"private {row['private'] / 1024:6.1f}")
+
+# Run the API in several processes: python prefork.py [--workers 4] [--port 5000]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the CAPTCHA API in prefork worker processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--report-interval', type=float, default=60.0,
+                        help='seconds between memory reports')
+    args = parser.parse_args()
+    
+    if not hasattr(os, 'fork'):
+        print("❌ prefork.py needs os.fork (Linux or macOS); use python api.py instead")
+        raise SystemExit(1)
+    
+    print("=" * 70)
+    print(f"🚀 PREFORK CAPTCHA API: {args.workers} workers on http://{args.host}:{args.port}")
+    print("=" * 70)
+    server = PreforkServer(workers=args.workers, host=args.host, port=args.port,
+                           report_interval=args.report_interval).start()
+    server.supervise()
@@ -0,0 +1,87 @@
+import json
+import random
+import sys
+import threading
+from array import array
+
+DEFAULT_QUIZ_FILE = 'quiz_bank.json'
+
+# Banks already loaded in this process, by file name
+_loaded_banks = {}
+_load_lock = threading.Lock()
+
+class QuizBank:
+    """
+    Quiz questions loaded once from a JSON file into an indexed structure
+    
+    Every question has an integer id. Each category keeps an array of its
+    ids, so picking a random question, looking up an answer by id and
+    reading the statistics are all O(1) whatever the bank size.
+    Repeated strings (options like "Yes" or "7") are interned.
+    """
+    
+    def __init__(self, data):
+        self.categories = list(data['categories'].keys())
+        self.category_ids = {}
+        
+        # Parallel per-question fields, found by position
+        self._position = {}
+        self._category = []
+        self._question = []
+        self._options = []
+        self._correct = []
+        self._explanation = []
+        
+        for category, questions in data['categories'].items():
+            ids = array('I')
+            for q in questions:
+                qid = int(q['id'])
+                if qid in self._position:
+                    raise ValueError(f"Duplicate quiz question id: {qid}")
+                self._position[qid] = len(self._question)
+                self._category.append(sys.intern(category))
+                self._question.append(q['question'])
+                self._options.append(tuple(sys.intern(o) for o in q['options']))
+                self._correct.append(sys.intern(q['correct']))
+                self._explanation.append(q['explanation'])
+                ids.append(qid)
+            self.category_ids[category] = ids
+        
+        # Computed once; the bank never changes after loading
+        self.category_counts = {c: len(ids) for c, ids in self.category_ids.items()}
+        self.total_questions = len(self._question)
+        self.statistics = {
+            'total_categories': len(self.categories),
+            'total_questions': self.total_questions,
+            'categories': list(self.categories)
+        }
+    
+    @classmethod
+    def load(cls, filename=DEFAULT_QUIZ_FILE):
+        """Load a bank, reusing it if this process already loaded the file"""
+        with _load_lock:
+            if filename not in _loaded_banks:
+                with open(filename, encoding='utf-8') as f:
+                    _loaded_banks[filename] = cls(json.load(f))
+            return _loaded_banks[filename]
+    
+    def __contains__(self, qid):
+        return qid in self._position
+    
+    def random_id(self, category):
+        ids = self.category_ids[category]
+        return ids[random.randrange(len(ids))]
+    
+    def correct_answer(self, qid):
+        return self._correct[self._position[qid]]
+    
+    def get(self, qid):
+        """Question as a dict: category, question, options, correct, explanation"""
+        i = self._position[qid]
+        return {
+            'category': self._category[i],
+            'question': self._question[i],
+            'options': list(self._options[i]),
+            'correct': self._correct[i],
+            'explanation': self._explanation[i]
+        }
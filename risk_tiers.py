@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+from bisect import bisect_right
+import numpy as np
+
+DEFAULT_TIER_FILE = 'risk_tiers.json'
+
+class RiskTierTable:
+    """
+    Risk tiers: which action to take for a bot probability
+    
+    Each tier has an upper bound 'below' (the last tier has none), a
+    risk_level, an action, a captcha_type and a message. Lookup is a
+    bisect over the bounds. A table is never changed after it is built;
+    hot-swapping means building a new table and replacing the reference.
+    Every table counts how many lookups landed in each tier.
+    """
+    
+    def __init__(self, tiers, source=None):
+        if not tiers:
+            raise ValueError("Risk tier table is empty")
+        bounds = [tier['below'] for tier in tiers[:-1]]
+        if any(b is None for b in bounds) or tiers[-1].get('below') is not None:
+            raise ValueError("Only the last risk tier may (and must) have no upper bound")
+        if bounds != sorted(bounds):
+            raise ValueError("Risk tier bounds must be increasing")
+        
+        self.tiers = [dict(tier) for tier in tiers]
+        self.bounds = bounds
+        self.source = source
+        
+        # Columns for the vectorized path (check_users)
+        self.bounds_array = np.array(bounds, dtype=np.float64)
+        self.risk_levels = np.array([t['risk_level'] for t in tiers])
+        self.actions = np.array([t['action'] for t in tiers])
+        self.captcha_types = np.array([t.get('captcha_type') for t in tiers], dtype=object)
+        
+        self.counts = [0] * len(tiers)
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def load(cls, filename=DEFAULT_TIER_FILE):
+        with open(filename, encoding='utf-8') as f:
+            return cls(json.load(f)['tiers'], source=filename)
+    
+    def lookup(self, bot_prob):
+        """Tier dict for one probability (counted)"""
+        index = bisect_right(self.bounds, bot_prob)
+        with self._lock:
+            self.counts[index] += 1
+        return self.tiers[index]
+    
+    def lookup_many(self, bot_probs):
+        """Tier index for each probability (counted)"""
+        indexes = np.searchsorted(self.bounds_array, bot_probs, side='right')
+        added = np.bincount(indexes, minlength=len(self.tiers))
+        with self._lock:
+            for i, n in enumerate(added):
+                self.counts[i] += int(n)
+        return indexes
+    
+    def get_statistics(self):
+        total = sum(self.counts)
+        return [{
+            'risk_level': tier['risk_level'],
+            'below': tier['below'],
+            'action': tier['action'],
+            'count': count,
+            'share': count / total if total else 0.0
+        } for tier, count in zip(self.tiers, self.counts)]
+
+class RiskTierFile:
+    """
+    Keeps a RiskTierTable in sync with its JSON file
+    The file's modification time is checked at most every check_interval seconds
+    """
+    
+    def __init__(self, filename=DEFAULT_TIER_FILE, check_interval=5.0):
+        self.filename = filename
+        self.check_interval = check_interval
+        self.table = RiskTierTable.load(filename)
+        self.reloads = 0
+        self._mtime = os.path.getmtime(filename)
+        self._next_check = 0.0
+    
+    def current(self, now):
+        """The current table, reloading it first if the file changed"""
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.path.getmtime(self.filename)
+                if mtime != self._mtime:
+                    self.table = RiskTierTable.load(self.filename)
+                    self._mtime = mtime
+                    self.reloads += 1
+                    print(f"🔁 Reloaded risk tiers from {self.filename}")
+            except (OSError, ValueError, KeyError) as e:
+                # Keep serving with the old table if the new file is broken
+                print(f"⚠️  Could not reload risk tiers: {e}")
+        return self.table
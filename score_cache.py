@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+# How coarsely each feature is rounded before looking up the cache
+DEFAULT_RESOLUTION = {
+    'mouse_count': 1,
+    'avg_mouse_speed': 5.0,
+    'keystroke_count': 1,
+    'typing_speed': 0.1,
+    'session_duration': 0.5
+}
+
+class ScoreCache:
+    """
+    LRU cache of bot probabilities keyed on quantized feature vectors
+    
+    Near-identical sessions (e.g. a bot replaying the same script) land in
+    the same bucket and reuse the score instead of running the model again.
+    With check_drift=True every hit is also scored exactly, to measure how
+    far cached scores are from the real ones.
+    """
+    
+    def __init__(self, max_size=10000, resolution=None, check_drift=False):
+        self.max_size = max_size
+        self.resolution = resolution if resolution is not None else DEFAULT_RESOLUTION
+        self.check_drift = check_drift
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.drift_checks = 0
+        self.drift_total = 0.0
+        self.drift_max = 0.0
+    
+    def make_key(self, features, feature_names):
+        """Round every feature to its bucket"""
+        if isinstance(self.resolution, dict):
+            return tuple(
+                round(features[name] / self.resolution.get(name, 1)) for name in feature_names
+            )
+        return tuple(round(features[name] / self.resolution) for name in feature_names)
+    
+    def get(self, key):
+        """Cached score or None; a hit moves the entry to the front"""
+        with self._lock:
+            score = self._entries.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return score
+    
+    def put(self, key, score):
+        with self._lock:
+            self._entries[key] = score
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def record_drift(self, cached_score, exact_score):
+        """Remember how far a cached score was from the exact one"""
+        drift = float(abs(cached_score - exact_score))
+        with self._lock:
+            self.drift_checks += 1
+            self.drift_total += drift
+            self.drift_max = max(self.drift_max, drift)
+    
+    def clear(self):
+        """Drop every entry (called when the model is reloaded)"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+    
+    def get_statistics(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+        if self.check_drift:
+            stats['drift'] = {
+                'checks': self.drift_checks,
+                'mean': self.drift_total / self.drift_checks if self.drift_checks else 0.0,
+                'max': self.drift_max
+            }
+        return stats
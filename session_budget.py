@@ -0,0 +1,163 @@
+import threading
+
+class SessionBudget:
+    """
+    Caps the session store by session count and estimated bytes
+    
+    When the store is over budget, sessions are evicted until it is back
+    under low_watermark of each limit:
+    1. decided sessions first (compacted: they already have a final
+       verdict), oldest first
+    2. then by CLOCK (second chance) in insertion order: a session used
+       since the hand last passed it is moved to the back of the line
+       instead of being evicted, so idle sessions go first
+    3. then, if every session was in use, in that new order
+    
+    The eviction order is kept here, not in the shared sessions dict, so
+    request threads never see a live session disappear and come back. Each
+    session's size is re-estimated when it is touched with its tracker, so
+    the byte total is a running sum. Both limits are checked on every new
+    session and every check_interval seconds on a background thread.
+    """
+    
+    def __init__(self, sessions, max_sessions=100000, max_bytes=512 * 1024 * 1024,
+                 low_watermark=0.9, check_interval=1.0, on_evict=None):
+        self.sessions = sessions  # session_id -> BehaviorTracker (shared with the API)
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.low_watermark = low_watermark
+        self.check_interval = check_interval
+        self.on_evict = on_evict  # called with the evicted session ids
+        
+        self.order = {}  # session ids in CLOCK order (dict as ordered set)
+        self.referenced = set()  # used since the clock hand last passed them
+        self.decided = {}  # decided session ids, oldest first (dict as ordered set)
+        self.session_bytes = {}  # session id -> estimated bytes when last touched
+        self.estimated_bytes = 0
+        self.stats = {'evicted_decided': 0, 'evicted_idle': 0, 'evicted_in_use': 0,
+                      'second_chances': 0, 'eviction_passes': 0}
+        
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='session-budget', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stopped.set()
+    
+    def _run(self):
+        while not self._stopped.wait(self.check_interval):
+            try:
+                self.enforce()
+            except Exception as e:
+                print(f"⚠️  Session budget check failed: {e}")
+    
+    def add(self, session_id, tracker):
+        """Start counting a session that was just put in the store"""
+        with self._lock:
+            self.order[session_id] = None
+        self.resize(session_id, tracker)
+    
+    def resize(self, session_id, tracker):
+        """Re-estimate one session's size (after events were added or it was compacted)"""
+        size = tracker.estimated_bytes()
+        with self._lock:
+            if session_id in self.order:
+                self.estimated_bytes += size - self.session_bytes.get(session_id, 0)
+                self.session_bytes[session_id] = size
+    
+    def touch(self, session_id, tracker=None):
+        """Mark a session as recently used (and re-estimate its size if tracker is given)"""
+        self.referenced.add(session_id)
+        if tracker is not None:
+            self.resize(session_id, tracker)
+    
+    def note_decided(self, session_id, tracker=None):
+        """The session has its final verdict and can be evicted first"""
+        with self._lock:
+            self.decided[session_id] = None
+            self.referenced.discard(session_id)
+        if tracker is not None:
+            self.resize(session_id, tracker)
+    
+    def enforce(self):
+        """Evict sessions if over budget; returns how many were evicted"""
+        over_count = len(self.sessions) > self.max_sessions
+        over_bytes = self.estimated_bytes > self.max_bytes
+        if not (over_count or over_bytes):
+            return 0
+        
+        with self._lock:
+            target_count = int(self.max_sessions * self.low_watermark)
+            target_bytes = int(self.max_bytes * self.low_watermark)
+            evicted = []
+            
+            def over():
+                return (len(self.sessions) > target_count or
+                        (over_bytes and self.estimated_bytes > target_bytes))
+            
+            for session_id in list(self.decided):
+                if not over():
+                    break
+                if self._evict(session_id):
+                    evicted.append(session_id)
+                    self.stats['evicted_decided'] += 1
+            
+            # One turn of the clock: used sessions go to the back of the line
+            for session_id in list(self.order):
+                if not over():
+                    break
+                if session_id in self.referenced:
+                    self.referenced.discard(session_id)
+                    self.order[session_id] = self.order.pop(session_id)
+                    self.stats['second_chances'] += 1
+                elif self._evict(session_id):
+                    evicted.append(session_id)
+                    self.stats['evicted_idle'] += 1
+            
+            # Still over (everything was in use): evict in the new order
+            for session_id in list(self.order):
+                if not over():
+                    break
+                if self._evict(session_id):
+                    evicted.append(session_id)
+                    self.stats['evicted_in_use'] += 1
+            
+            self.stats['eviction_passes'] += 1
+        
+        if evicted:
+            if self.on_evict:
+                self.on_evict(evicted)
+            print(f"🗑️  Memory budget: evicted {len(evicted)} sessions")
+        return len(evicted)
+    
+    def _evict(self, session_id):
+        tracker = self.sessions.pop(session_id, None)
+        self._drop(session_id)
+        return tracker is not None
+    
+    def _drop(self, session_id):
+        self.order.pop(session_id, None)
+        self.referenced.discard(session_id)
+        self.decided.pop(session_id, None)
+        self.estimated_bytes -= self.session_bytes.pop(session_id, 0)
+    
+    def forget(self, session_ids):
+        """Drop bookkeeping for sessions removed elsewhere (e.g. expired)"""
+        with self._lock:
+            for session_id in session_ids:
+                self._drop(session_id)
+    
+    def get_statistics(self):
+        return {
+            **self.stats,
+            'sessions': len(self.sessions),
+            'max_sessions': self.max_sessions,
+            'estimated_bytes': self.estimated_bytes,
+            'max_bytes': self.max_bytes,
+            'decided_sessions': len(self.decided)
+        }
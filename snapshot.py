@@ -0,0 +1,210 @@
+import atexit
+import json
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+import numpy as np
+import clock
+from tracker import BehaviorTracker, SessionSummary
+
+# Snapshot file layout (little-endian):
+#   header:  magic "CSNP", version (1 byte), written at (float64),
+#            session count (uint32), CAPTCHA count (uint32)
+#   session: id (36 bytes), handle (uint32), start time (float64),
+#            speed sum (float64), speed count, mouse count, key count,
+#            skipped mouse movements (uint32 each), compacted (1 byte)
+#            then float32 arrays: mouse x, mouse y, mouse times, key times
+#            (times are seconds since the session started)
+#            or, for a compacted session, its summary: the 5 features (float64),
+#            event count (uint32), probability (NaN if unknown), decided at (float64),
+#            verdict (16 bytes)
+#   CAPTCHA: session id (36 bytes), generated at (float64), JSON length (uint32), JSON
+MAGIC = b'CSNP'
+VERSION = 3
+HEADER = struct.Struct('<4sBdII')
+SESSION = struct.Struct('<36sIddIIIIB')
+SUMMARY = struct.Struct('<5dIdd16s')
+CAPTCHA = struct.Struct('<36sdI')
+
+class SessionSnapshotter:
+    """
+    Saves the API's session store to disk and restores it on startup
+    
+    Saving runs on a background thread and copies sessions in small batches,
+    yielding to request threads between batches, so a snapshot never holds
+    up requests for long. Each save goes to a temporary file that replaces
+    the old snapshot only when complete. Key text isn't saved (the features
+    only use key timings).
+    """
+    
+    def __init__(self, path, sessions, active_captchas, session_handles, ttl=600,
+                 interval=30.0, batch_size=200):
+        self.path = path
+        self.sessions = sessions
+        self.active_captchas = active_captchas
+        self.session_handles = session_handles
+        self.ttl = ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        
+        self.stats = {'snapshots': 0, 'last_sessions': 0, 'last_bytes': 0, 'last_seconds': 0.0,
+                      'restored': 0, 'expired_skipped': 0}
+        self._save_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Save every interval seconds in the background, and once more at exit"""
+        self._thread = threading.Thread(target=self._run, name='session-snapshots', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+    
+    def stop(self):
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self.save()
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.save()
+            except OSError as e:
+                print(f"⚠️  Session snapshot failed: {e}")
+    
+    def save(self):
+        """Write a snapshot; returns the number of sessions saved"""
+        with self._save_lock:
+            started = time.perf_counter()
+            now = clock.now()
+            handles = {sid: handle for handle, sid in list(self.session_handles.items())}
+            items = [(sid, tracker) for sid, tracker in list(self.sessions.items())
+                     if now - tracker.start_time <= self.ttl]
+            tmp_path = self.path + '.tmp'
+            
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, now, 0, 0))
+                for start in range(0, len(items), self.batch_size):
+                    f.write(b''.join(
+                        self._pack_session(sid, tracker, handles.get(sid, 0))
+                        for sid, tracker in items[start:start + self.batch_size]
+                    ))
+                    time.sleep(0)  # Let request threads run between batches
+                saved = len(items)
+                
+                captchas = 0
+                for sid, entry in list(self.active_captchas.items()):
+                    if sid in self.sessions:
+                        body = json.dumps(entry['captcha']).encode()
+                        f.write(CAPTCHA.pack(sid.encode(), entry['generated_at'], len(body)) + body)
+                        captchas += 1
+                
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, VERSION, now, saved, captchas))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            
+            self.stats['snapshots'] += 1
+            self.stats['last_sessions'] = saved
+            self.stats['last_bytes'] = os.path.getsize(self.path)
+            self.stats['last_seconds'] = time.perf_counter() - started
+            return saved
+    
+    @staticmethod
+    def _pack_session(session_id, tracker, handle):
+        summary = tracker.summary
+        if summary:
+            return (SESSION.pack(session_id.encode(), handle, tracker.start_time, 0.0, 0, 0, 0, 0, 1) +
+                    SUMMARY.pack(*summary.features, summary.events,
+                                 math.nan if summary.probability is None else summary.probability,
+                                 summary.decided_at, summary.verdict.encode()))
+        
+        # Arrays can grow while we copy them; only keep complete events.
+        # Slices are copies, so request threads can keep appending (a numpy
+        # view would lock the arrays' size until it is released).
+        n_mouse = min(len(tracker.mouse_x), len(tracker.mouse_y), len(tracker.mouse_time))
+        start = tracker.start_time
+        mouse_x = np.frombuffer(tracker.mouse_x[:n_mouse], dtype=np.float64)
+        mouse_y = np.frombuffer(tracker.mouse_y[:n_mouse], dtype=np.float64)
+        mouse_time = np.frombuffer(tracker.mouse_time[:n_mouse], dtype=np.float64)
+        key_time = np.frombuffer(tracker.key_time[:], dtype=np.float64)
+        n_keys = len(key_time)
+        return b''.join([
+            SESSION.pack(session_id.encode(), handle, start, tracker.speed_sum,
+                         tracker.speed_count, n_mouse, n_keys, tracker.mouse_skipped, 0),
+            mouse_x.astype('<f4').tobytes(),
+            mouse_y.astype('<f4').tobytes(),
+            (mouse_time - start).astype('<f4').tobytes(),
+            (key_time - start).astype('<f4').tobytes()
+        ])
+    
+    def load(self):
+        """Restore sessions that haven't expired; returns (restored, skipped)"""
+        if not os.path.exists(self.path):
+            return 0, 0
+        
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        magic, version, _, n_sessions, n_captchas = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self.path} is not a session snapshot')
+        
+        now = clock.now()
+        offset = HEADER.size
+        restored = skipped = 0
+        for _ in range(n_sessions):
+            (raw_id, handle, start, speed_sum, speed_count, n_mouse, n_keys,
+             mouse_skipped, compacted) = SESSION.unpack_from(data, offset)
+            offset += SESSION.size
+            if compacted:
+                *features, events, probability, decided_at, verdict = SUMMARY.unpack_from(data, offset)
+                offset += SUMMARY.size
+            else:
+                columns = np.frombuffer(data, dtype='<f4', count=3 * n_mouse + n_keys, offset=offset)
+                offset += columns.nbytes
+            
+            if now - start > self.ttl:
+                skipped += 1
+                continue
+            
+            tracker = BehaviorTracker()
+            tracker.start_time = start
+            if compacted:
+                tracker.set_summary(SessionSummary(features, verdict.rstrip(b'\0').decode(),
+                                                   None if math.isnan(probability) else probability,
+                                                   events, start, decided_at))
+            else:
+                tracker.speed_sum = speed_sum
+                tracker.speed_count = speed_count
+                tracker.mouse_skipped = mouse_skipped
+                tracker.mouse_x = array('d', columns[:n_mouse].astype(np.float64).tobytes())
+                tracker.mouse_y = array('d', columns[n_mouse:2 * n_mouse].astype(np.float64).tobytes())
+                tracker.mouse_time = array('d', (columns[2 * n_mouse:3 * n_mouse].astype(np.float64) + start).tobytes())
+                tracker.key_time = array('d', (columns[3 * n_mouse:].astype(np.float64) + start).tobytes())
+                tracker.keys = [''] * n_keys
+            
+            session_id = raw_id.decode()
+            self.sessions[session_id] = tracker
+            if handle:
+                self.session_handles[handle] = session_id
+            restored += 1
+        
+        for _ in range(n_captchas):
+            raw_id, generated_at, length = CAPTCHA.unpack_from(data, offset)
+            offset += CAPTCHA.size
+            session_id = raw_id.decode()
+            if session_id in self.sessions:
+                captcha = json.loads(data[offset:offset + length])
+                self.active_captchas[session_id] = {'captcha': captcha, 'generated_at': generated_at}
+            offset += length
+        
+        self.stats['restored'] += restored
+        self.stats['expired_skipped'] += skipped
+        return restored, skipped
+    
+    def get_statistics(self):
+        return {**self.stats, 'path': self.path, 'interval': self.interval}
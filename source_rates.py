@@ -0,0 +1,135 @@
+import hashlib
+import threading
+from functools import lru_cache
+import numpy as np
+import clock
+
+# Per-client limits over the sliding window: (soft, hard)
+# Past soft, the client's bot probability is raised (see SourceRates.risk);
+# past hard, its requests are turned away before any tracker or model work.
+DEFAULT_LIMITS = {
+    'session_starts': (10, 60),
+    'track_events': (6000, 30000),
+    'failed_quizzes': (3, 15)
+}
+
+class SlidingCountMinSketch:
+    """
+    Approximate per-key counts over the last window seconds, in fixed memory
+    
+    A count-min sketch (depth rows of width counters; a key adds to one
+    counter per row and its count is the smallest of them, so it can only
+    be over-, never under-estimated) for each of n_buckets time buckets.
+    Buckets form a ring keyed by absolute bucket number (time // bucket
+    length): a slot is zeroed when a different bucket number lands on it,
+    and only buckets inside the window are counted, so counts also expire
+    correctly when the clock jumps backwards (traffic replay).
+    """
+    
+    def __init__(self, width=2048, depth=4, window=60.0, n_buckets=12):
+        self.width = width
+        self.depth = depth
+        self.window = window
+        self.n_buckets = n_buckets
+        self.bucket_seconds = window / n_buckets
+        
+        self.counters = np.zeros((n_buckets, depth, width), dtype=np.uint32)
+        self._rows = np.arange(depth)
+        self._bucket_ids = np.full(n_buckets, -1, dtype=np.int64)  # bucket number held by each slot
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _columns(key, depth, width):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * depth).digest()
+        return np.frombuffer(digest, dtype=np.uint32) % width
+    
+    def _slot(self, bucket):
+        """Ring slot for a bucket number, zeroed if it held another bucket"""
+        slot = bucket % self.n_buckets
+        if self._bucket_ids[slot] != bucket:
+            self.counters[slot] = 0
+            self._bucket_ids[slot] = bucket
+        return slot
+    
+    def _in_window(self, bucket):
+        """Slots holding one of the n_buckets buckets up to and including `bucket`"""
+        return (self._bucket_ids > bucket - self.n_buckets) & (self._bucket_ids <= bucket)
+    
+    def add(self, key, count=1):
+        columns = self._columns(key, self.depth, self.width)
+        bucket = int(clock.now() // self.bucket_seconds)
+        with self._lock:
+            self.counters[self._slot(bucket), self._rows, columns] += count
+    
+    def estimate(self, key):
+        """Count for key over the window (may be a little high, never low)"""
+        columns = self._columns(key, self.depth, self.width)
+        bucket = int(clock.now() // self.bucket_seconds)
+        with self._lock:
+            counts = self.counters[self._in_window(bucket)][:, self._rows, columns]
+            return int(counts.sum(axis=0).min()) if len(counts) else 0
+
+def client_keys(client):
+    """A client is one key or a tuple of keys (e.g. its IP and its fingerprint)"""
+    return (client,) if isinstance(client, str) else tuple(client)
+
+class SourceRates:
+    """
+    Sliding-window counters per client for session starts, track events
+    and failed quizzes, so sessions opened from the same source can be
+    judged together
+    
+    A client can be several keys (its IP address and its fingerprint):
+    each key is counted on its own, and the client is over a limit when
+    any of its keys is, so changing one of them doesn't reset the counts.
+    """
+    
+    def __init__(self, limits=None, window=60.0, width=2048, depth=4):
+        self.limits = limits if limits is not None else DEFAULT_LIMITS
+        self.window = window
+        self.sketches = {metric: SlidingCountMinSketch(width, depth, window) for metric in self.limits}
+        self.stats = {'noted': {metric: 0 for metric in self.limits}, 'rejected': 0, 'raised': 0}
+    
+    def note(self, metric, client, count=1):
+        for key in client_keys(client):
+            self.sketches[metric].add(key, count)
+        self.stats['noted'][metric] += count
+    
+    def counts(self, client):
+        """Count per metric for the client's busiest key"""
+        keys = client_keys(client)
+        return {metric: max((sketch.estimate(key) for key in keys), default=0)
+                for metric, sketch in self.sketches.items()}
+    
+    def reject_reason(self, client):
+        """Why this client is over a hard limit, or None"""
+        for metric, count in self.counts(client).items():
+            if count > self.limits[metric][1]:
+                self.stats['rejected'] += 1
+                return f'{metric} over {self.limits[metric][1]} per {self.window:g}s'
+        return None
+    
+    def risk(self, client):
+        """
+        Bot probability floor for this client's sessions: 0 while every
+        count is under its soft limit, then rising from 0.6 at the soft
+        limit to 0.95 at the hard one
+        """
+        over = []
+        for metric, count in self.counts(client).items():
+            soft, hard = self.limits[metric]
+            if count >= soft:
+                over.append(min(1.0, (count - soft) / max(hard - soft, 1)))
+        if not over:
+            return 0.0
+        self.stats['raised'] += 1
+        return 0.6 + 0.35 * max(over)
+    
+    def get_statistics(self):
+        return {
+            **self.stats,
+            'window_seconds': self.window,
+            'limits': {metric: {'soft': soft, 'hard': hard} for metric, (soft, hard) in self.limits.items()},
+            'memory_bytes': sum(sketch.counters.nbytes for sketch in self.sketches.values())
+        }
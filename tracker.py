@@ -1,5 +1,28 @@
 import time
 import json
+import sys
+from array import array
+import numpy as np
+import clock
+from event_frames import MOUSE_EVENT, KEY_EVENT
+
+# Feature order used by SessionSummary (and snapshot files)
+FEATURE_NAMES = ('mouse_count', 'avg_mouse_speed', 'keystroke_count', 'typing_speed', 'session_duration')
+
+class SessionSummary:
+    """
+    What's left of a session after its final verdict (see BehaviorTracker.compact)
+    Read-only: features are frozen at decided_at, in FEATURE_NAMES order.
+    """
+    __slots__ = ('features', 'verdict', 'probability', 'events', 'start_time', 'decided_at')
+    
+    def __init__(self, features, verdict, probability, events, start_time, decided_at):
+        values = (tuple(features), verdict, probability, events, start_time, decided_at)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('SessionSummary is read-only')
 
 class BehaviorTracker:
     """
@@ -7,66 +30,168 @@ class BehaviorTracker:
     """
     
     def __init__(self):
-        # Store all tracked events
-        self.mouse_data = []
-        self.keyboard_data = []
-        self.start_time = time.time()
+        # Store all tracked events as columns (one entry per event)
+        self.mouse_x = array('d')
+        self.mouse_y = array('d')
+        self.mouse_time = array('d')
+        self.keys = []
+        self.key_time = array('d')
+        self.start_time = clock.now()
+        
+        # Running totals so get_features() doesn't rescan every event
+        self.speed_sum = 0.0
+        self.speed_count = 0
+        # Mouse movements counted but not stored (dropped under overload)
+        self.mouse_skipped = 0
+        
+        # Set by compact() once the session has its final verdict
+        self.summary = None
+        # Set once the session's features went into the API's drift monitor
+        self.drift_observed = False
     
-    def add_mouse_movement(self, x, y):
+    def add_mouse_movement(self, x, y, timestamp=None):
         """
         Save mouse position and when it happened
         x, y = mouse coordinates on screen
+        timestamp = when it happened (default: now)
         """
-        self.mouse_data.append({
-            'x': x,
-            'y': y,
-            'time': time.time()
-        })
+        if self.summary:
+            return  # Already decided, events aren't needed any more
+        if timestamp is None:
+            timestamp = clock.now()
+        
+        if self.mouse_x:
+            # Speed from the previous point = distance / time
+            distance = ((x - self.mouse_x[-1])**2 + (y - self.mouse_y[-1])**2) ** 0.5
+            time_diff = timestamp - self.mouse_time[-1]
+            if time_diff > 0:
+                self.speed_sum += distance / time_diff
+                self.speed_count += 1
+        
+        self.mouse_x.append(x)
+        self.mouse_y.append(y)
+        self.mouse_time.append(timestamp)
+    
+    def skip_mouse_movements(self, count=1):
+        """
+        Count mouse movements without storing them, so mouse_count stays
+        right when the API thins events under load
+        """
+        if not self.summary:
+            self.mouse_skipped += count
     
-    def add_keystroke(self, key):
+    def add_keystroke(self, key, timestamp=None):
         """
         Save what key was pressed and when
         """
-        self.keyboard_data.append({
-            'key': key,
-            'time': time.time()
-        })
+        if self.summary:
+            return
+        self.keys.append(key)
+        self.key_time.append(clock.now() if timestamp is None else timestamp)
     
-    def get_features(self):
+    def add_events(self, event_types, x, y, timestamps):
+        """
+        Save a batch of events given as numpy columns (binary /api/track)
+        The columns are copied straight into the tracker's arrays.
+        Keystrokes from a batch have no key text.
+        """
+        if self.summary:
+            return
+        mouse = event_types == MOUSE_EVENT
+        mx = x[mouse].astype(np.float64)
+        my = y[mouse].astype(np.float64)
+        mt = timestamps[mouse].astype(np.float64)
+        
+        # Speeds between consecutive points, starting from the last stored one
+        if len(self.mouse_x):
+            px = np.concatenate(([self.mouse_x[-1]], mx))
+            py = np.concatenate(([self.mouse_y[-1]], my))
+            pt = np.concatenate(([self.mouse_time[-1]], mt))
+        else:
+            px, py, pt = mx, my, mt
+        if len(px) > 1:
+            time_diff = np.diff(pt)
+            moving = time_diff > 0
+            distance = np.hypot(np.diff(px), np.diff(py))
+            self.speed_sum += float((distance[moving] / time_diff[moving]).sum())
+            self.speed_count += int(moving.sum())
+        
+        self.mouse_x.frombytes(mx.tobytes())
+        self.mouse_y.frombytes(my.tobytes())
+        self.mouse_time.frombytes(mt.tobytes())
+        
+        keys = event_types == KEY_EVENT
+        self.key_time.frombytes(timestamps[keys].astype(np.float64).tobytes())
+        self.keys.extend([''] * int(keys.sum()))
+    
+    def event_count(self):
+        if self.summary:
+            return self.summary.events
+        return len(self.mouse_x) + len(self.key_time)
+    
+    def compact(self, verdict, probability=None, now=None):
+        """
+        Replace the recorded events with a SessionSummary once the session
+        has its final verdict (e.g. 'allow' or 'quiz_passed'), with the bot
+        probability behind it if known. Later events are ignored and
+        get_features() returns the frozen features.
+        Returns the number of bytes freed (0 if already compacted).
+        """
+        if self.summary:
+            return 0
+        now = clock.now() if now is None else now
+        features = self.get_features(now=now)
+        return self.set_summary(SessionSummary([features[name] for name in FEATURE_NAMES], verdict,
+                                               probability, self.event_count(), self.start_time, now))
+    
+    def set_summary(self, summary):
+        """
+        Drop the recorded events and keep only summary; returns the bytes freed
+        The columns are swapped for empty ones rather than removed, so a
+        tracking call racing with this one can't fail (its event is ignored).
+        """
+        old_size = self._columns_size()
+        self.summary = summary
+        self.mouse_x = array('d')
+        self.mouse_y = array('d')
+        self.mouse_time = array('d')
+        self.keys = []
+        self.key_time = array('d')
+        new_size = self._columns_size() + sys.getsizeof(summary) + sys.getsizeof(summary.features)
+        return max(0, old_size - new_size)
+    
+    def estimated_bytes(self):
+        """Rough memory used by this tracker (key text not included)"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__) + self._columns_size()
+        if self.summary:
+            size += sys.getsizeof(self.summary) + sys.getsizeof(self.summary.features)
+        return size
+    
+    def _columns_size(self):
+        columns = [self.mouse_x, self.mouse_y, self.mouse_time, self.keys, self.key_time]
+        return sum(sys.getsizeof(column) for column in columns)
+    
+    def get_features(self, now=None):
         """
         Convert raw data into features the ML model can understand
+        now = the time to measure the session up to (default: now)
         """
+        if self.summary:
+            return dict(zip(FEATURE_NAMES, self.summary.features))
+        
         features = {}
         
         # Feature 1: How many mouse movements?
-        features['mouse_count'] = len(self.mouse_data)
+        features['mouse_count'] = len(self.mouse_x) + self.mouse_skipped
         
-        # Feature 2: Average mouse speed
-        if len(self.mouse_data) > 1:
-            speeds = []
-            for i in range(1, len(self.mouse_data)):
-                # Calculate distance between two points
-                x1, y1 = self.mouse_data[i-1]['x'], self.mouse_data[i-1]['y']
-                x2, y2 = self.mouse_data[i]['x'], self.mouse_data[i]['y']
-                distance = ((x2-x1)**2 + (y2-y1)**2) ** 0.5
-                
-                # Calculate time difference
-                time_diff = self.mouse_data[i]['time'] - self.mouse_data[i-1]['time']
-                
-                # Speed = distance / time
-                if time_diff > 0:
-                    speed = distance / time_diff
-                    speeds.append(speed)
-            
-            features['avg_mouse_speed'] = sum(speeds) / len(speeds) if speeds else 0
-        else:
-            features['avg_mouse_speed'] = 0
+        # Feature 2: Average mouse speed (kept up to date as points arrive)
+        features['avg_mouse_speed'] = self.speed_sum / self.speed_count if self.speed_count else 0
         
         # Feature 3: How many keys pressed?
-        features['keystroke_count'] = len(self.keyboard_data)
+        features['keystroke_count'] = len(self.key_time)
         
         # Feature 4: Typing speed (keys per second)
-        session_time = time.time() - self.start_time
+        session_time = (clock.now() if now is None else now) - self.start_time
         features['typing_speed'] = features['keystroke_count'] / session_time if session_time > 0 else 0
         
         # Feature 5: Total session time
@@ -0,0 +1,389 @@
+import argparse
+import atexit
+import base64
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import clock
+from event_frames import TRACK_CONTENT_TYPE, TRACK_RECORD_DTYPE, apply_frame
+from overload import NORMAL, DEGRADED, SHEDDING
+
+# Traffic log: one API call per line
+#   {"offset": 1.25, "ts": 1760000000.5, "method": "POST", "route": "/api/track",
+#    "content_type": "application/json", "body": {...}, "status": 200, "response": {...}}
+# offset = seconds since recording started, ts = clock time when the call arrived.
+# "client" (rate-limit keys: "ip:<address>" and, if sent, "fp:<fingerprint>",
+# see api.client_keys) is stored when known.
+# Binary bodies (and JSON bodies that don't parse) are stored base64-encoded
+# in "body_b64" instead of "body".
+# WebSocket traffic (api_async.py) has method "WS": a body is one event frame,
+# no body is a live verdict check with its result as the response.
+
+class TrafficRecorder:
+    """
+    Appends API calls to a JSONL log
+    
+    Calls are buffered and written in batches (every batch_size calls or
+    flush_interval seconds, whichever comes first). When the file would grow
+    past max_bytes it is rotated like a log file: traffic.jsonl ->
+    traffic.jsonl.1 -> ... -> traffic.jsonl.<backups>.
+    """
+    
+    def __init__(self, path='traffic.jsonl', max_bytes=50 * 1024 * 1024, backups=5,
+                 batch_size=500, flush_interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        
+        self.started_at = clock.now()
+        self.stats = {'recorded': 0, 'batches': 0, 'rotations': 0}
+        
+        self._buffer = []
+        self._lock = threading.Lock()  # guards _buffer
+        self._write_lock = threading.Lock()  # one batch written at a time
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Flush on a timer in the background, and once more at exit"""
+        self._thread = threading.Thread(target=self._run, name='traffic-recorder', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+    
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+    
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+    
+    def record(self, method, route, content_type, body, status, response, arrived_at, client=None):
+        """Buffer one call (body as raw bytes, response as a dict or None)"""
+        entry = {
+            'offset': round(arrived_at - self.started_at, 6),
+            'ts': arrived_at,
+            'method': method,
+            'route': route,
+            'content_type': content_type,
+            'status': status,
+            'response': response
+        }
+        if client is not None:
+            entry['client'] = list(client)
+        if content_type == 'application/json':
+            try:
+                entry['body'] = json.loads(body) if body else None
+            except ValueError:
+                # Malformed JSON (answered with a 400): keep the bytes as sent
+                entry['body_b64'] = base64.b64encode(body).decode()
+        elif body:
+            entry['body_b64'] = base64.b64encode(body).decode()
+        
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+    
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        
+        data = ''.join(lines).encode('utf-8')
+        with self._write_lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self.stats['recorded'] += len(lines)
+            self.stats['batches'] += 1
+    
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{i}'):
+                os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self.stats['rotations'] += 1
+    
+    def get_statistics(self):
+        return {**self.stats, 'buffered': len(self._buffer), 'path': self.path}
+
+def log_files(path):
+    """A log and its rotated backups, oldest first"""
+    files = []
+    i = 1
+    while os.path.exists(f'{path}.{i}'):
+        files.append(f'{path}.{i}')
+        i += 1
+    return files[::-1] + ([path] if os.path.exists(path) else [])
+
+def read_log(files):
+    for name in files:
+        with open(name, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+def replay(files, speed=None):
+    """
+    Send recorded calls through the Flask app again and compare verdicts
+    
+    speed: None = as fast as possible, 1 = recorded pace, 10 = 10x faster.
+    BehaviorTracker and the API read a virtual clock that is set to each
+    call's recorded time, so features (and verdicts) don't depend on how
+    fast the replay runs. Early verdicts run on a background thread and
+    are switched off so every verdict is computed on the request path.
+    The traffic recorder and feature store are switched off too, so
+    replayed calls never land in a live log (or the log being replayed).
+    The overload mode is pinned to whatever each recorded response shows
+    (thinned events, fast scoring, a turned-away session).
+    """
+    import api
+    if api.early_verdicts:
+        api.early_verdicts.stop()
+        api.early_verdicts = None
+    if api.recorder:
+        api.recorder.stop()
+        api.recorder = None
+    if api.feature_store:
+        api.feature_store.stop()
+        api.feature_store = None
+    
+    virtual_clock = clock.VirtualClock()
+    clock.use(virtual_clock)
+    client = api.app.test_client()
+    
+    session_ids = {}  # recorded session id -> replayed session id
+    handles = {}  # recorded session handle -> replayed handle
+    lost = set()  # recorded session ids and handles whose start failed in the replay
+    latencies = {}
+    report = {'requests': 0, 'checked': 0, 'matched': 0, 'mismatches': [], 'skipped': 0}
+    
+    replay_start = time.perf_counter()
+    try:
+        for entry in read_log(files):
+            if speed:
+                delay = replay_start + entry['offset'] / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            virtual_clock.set(entry['ts'])
+            api.overload.force(_recorded_mode(entry))
+            
+            if lost and _session_refs(entry) & lost:
+                # Its session wasn't started this time (already counted as a mismatch)
+                report['skipped'] += 1
+                continue
+            
+            if entry['method'] == 'WS':
+                started = time.perf_counter()
+                status, replayed = _replay_stream(api, entry, session_ids)
+                latencies.setdefault('WS /api/stream', []).append(time.perf_counter() - started)
+                report['requests'] += 1
+                _check(entry, status, replayed, report)
+                continue
+            
+            kwargs = {'method': entry['method'], 'content_type': entry.get('content_type')}
+            ip, fingerprint = _recorded_client(entry)
+            if ip:
+                kwargs['environ_base'] = {'REMOTE_ADDR': ip}
+            if fingerprint:
+                kwargs['headers'] = {api.CLIENT_KEY_HEADER: fingerprint}
+            body = entry.get('body')
+            if isinstance(body, dict):
+                body = dict(body)
+                if 'session_id' in body:
+                    body['session_id'] = session_ids.get(body['session_id'], body['session_id'])
+                if 'session_ids' in body:
+                    body['session_ids'] = [session_ids.get(s, s) for s in body['session_ids']]
+                kwargs['json'] = body
+            elif 'body_b64' in entry:
+                kwargs['data'] = _rewrite_handles(base64.b64decode(entry['body_b64']), handles, entry)
+            
+            started = time.perf_counter()
+            response = client.open(entry['route'], **kwargs)
+            latencies.setdefault(entry['route'], []).append(time.perf_counter() - started)
+            report['requests'] += 1
+            
+            replayed = response.get_json(silent=True)
+            recorded = entry.get('response')
+            if entry['route'] == '/api/session/start' and entry['status'] == 200 and recorded:
+                if response.status_code == 200 and replayed:
+                    session_ids[recorded['session_id']] = replayed['session_id']
+                    if 'session_handle' in recorded:
+                        handles[recorded['session_handle']] = replayed['session_handle']
+                else:
+                    lost.add(recorded['session_id'])
+                    if 'session_handle' in recorded:
+                        lost.add(recorded['session_handle'])
+                    report['checked'] += 1
+                    report['mismatches'].append({'offset': entry['offset'], 'route': entry['route'],
+                                                 'recorded': [entry['status']], 'replayed': [response.status_code]})
+                    continue
+            elif entry['route'] == '/api/verify' and replayed and recorded:
+                _restore_captcha(api, recorded, replayed, body.get('session_id'))
+            
+            _check(entry, response.status_code, replayed, report)
+    finally:
+        clock.use(None)
+        api.overload.force(None)
+    
+    report['seconds'] = time.perf_counter() - replay_start
+    report['latency_ms'] = {
+        route: {'count': len(values), 'p50': _percentile(values, 50),
+                'p95': _percentile(values, 95), 'p99': _percentile(values, 99)}
+        for route, values in latencies.items()
+    }
+    return report
+
+def _replay_stream(api, entry, session_ids):
+    """One WebSocket event or live verdict check, applied the way api_async.py does"""
+    query = parse_qs(urlsplit(entry['route']).query)
+    recorded_id = query.get('session_id', [''])[0]
+    session_id = session_ids.get(recorded_id, recorded_id)
+    tracker = api.sessions.get(session_id)
+    if tracker is None:
+        return 400, None
+    
+    client = api.client_keys(*_recorded_client(entry))
+    if 'body_b64' in entry:
+        api.limit_client(client, 'track_events')
+        apply_frame(tracker, base64.b64decode(entry['body_b64']))
+    elif entry.get('body') is not None:
+        api.handle_track({**entry['body'], 'session_id': session_id}, client=client)
+    else:
+        source_risk = api.source_rates.risk(client) if client else 0.0
+        return 200, api.captcha_system.check_user(tracker.get_features(), source_risk)
+    return 200, None
+
+def _recorded_client(entry):
+    """(IP address, fingerprint) of a logged call; logs from before both were kept have one string"""
+    client = entry.get('client')
+    if isinstance(client, str):
+        return client, None
+    keys = dict(key.split(':', 1) for key in client or [])
+    return keys.get('ip'), keys.get('fp')
+
+def _recorded_mode(entry):
+    if entry['status'] == 503 and entry['route'] == '/api/session/start':
+        return SHEDDING
+    if (entry.get('response') or {}).get('degraded'):
+        return DEGRADED
+    return NORMAL
+
+def _session_refs(entry):
+    """Recorded session ids and handles a logged call refers to"""
+    refs = set()
+    body = entry.get('body')
+    if isinstance(body, dict):
+        refs.add(body.get('session_id'))
+        refs.update(body.get('session_ids') or [])
+    if entry['method'] == 'WS':
+        refs.update(parse_qs(urlsplit(entry['route']).query).get('session_id', []))
+    elif entry.get('content_type') == TRACK_CONTENT_TYPE and 'body_b64' in entry:
+        raw = base64.b64decode(entry['body_b64'])
+        records = np.frombuffer(raw, dtype=TRACK_RECORD_DTYPE, count=len(raw) // TRACK_RECORD_DTYPE.itemsize)
+        refs.update(int(h) for h in records['handle'])
+    refs.discard(None)
+    return refs
+
+def _rewrite_handles(body, handles, entry):
+    if entry.get('content_type') != TRACK_CONTENT_TYPE or not handles:
+        return body
+    records = np.frombuffer(body, dtype=TRACK_RECORD_DTYPE).copy()
+    records['handle'] = [handles.get(int(h), int(h)) for h in records['handle']]
+    return records.tobytes()
+
+def _restore_captcha(api, recorded, replayed, session_id):
+    """
+    Quiz questions are picked at random, so put the recorded challenge back
+    in place of the new one (only possible without signed tokens, where the
+    recorded response carries the answers)
+    """
+    captcha = recorded.get('captcha')
+    if captcha and 'token' not in captcha and session_id in api.active_captchas:
+        api.active_captchas[session_id]['captcha'] = captcha
+        replayed['captcha'] = captcha
+
+def _check(entry, status, replayed, report):
+    """Compare a replayed response with the recorded one"""
+    recorded = entry.get('response')
+    route = entry['route']
+    if recorded is None or replayed is None:
+        report['skipped'] += 1
+        return
+    
+    if route in ('/api/verify', '/api/verify/batch') or entry['method'] == 'WS':
+        if recorded.get('precomputed'):
+            # Came from a background early verdict, which replay switches off
+            report['skipped'] += 1
+            return
+        fields = ['action', 'probability']
+    elif route == '/api/verify/quiz':
+        if 'token' in (entry.get('body') or {}):
+            # A signed token is bound to the recorded session, so it can't be re-checked
+            report['skipped'] += 1
+            return
+        fields = ['verified']
+    else:
+        fields = []
+    
+    report['checked'] += 1
+    expected = [entry['status']] + [recorded.get(f) for f in fields]
+    actual = [status] + [replayed.get(f) for f in fields]
+    if expected == actual:
+        report['matched'] += 1
+    else:
+        report['mismatches'].append({'offset': entry['offset'], 'route': route,
+                                     'recorded': expected, 'replayed': actual})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay a recorded traffic log through the API')
+    parser.add_argument('log', nargs='?', default='traffic.jsonl',
+                        help='log to replay (rotated backups are replayed first)')
+    parser.add_argument('--speed', default='max',
+                        help="'max' (default), 1 for the recorded pace, 10 for 10x faster...")
+    args = parser.parse_args()
+    
+    files = log_files(args.log)
+    if not files:
+        print(f"❌ No traffic log at {args.log}")
+        print("   Record one with: CAPTCHA_TRAFFIC_LOG=traffic.jsonl python api.py")
+        raise SystemExit(1)
+    
+    speed = None if args.speed == 'max' else float(args.speed)
+    print(f"⏯️  Replaying {', '.join(files)} at {'maximum' if speed is None else f'{speed:g}x'} speed...")
+    report = replay(files, speed=speed)
+    
+    print("\n" + "=" * 60)
+    print("REPLAY REPORT")
+    print("=" * 60)
+    print(f"📨 {report['requests']} requests in {report['seconds']:.2f}s "
+          f"({report['requests'] / max(report['seconds'], 1e-9):,.0f}/s)")
+    print("\n⏱️  Latency (ms):")
+    for route, stats in sorted(report['latency_ms'].items()):
+        print(f"   {route:<22} n={stats['count']:<6} p50={stats['p50']:.2f}  "
+              f"p95={stats['p95']:.2f}  p99={stats['p99']:.2f}")
+    
+    print(f"\n🔍 Responses checked: {report['checked']} ({report['skipped']} skipped)")
+    if report['mismatches']:
+        print(f"❌ {len(report['mismatches'])} responses differ from the recording:")
+        for m in report['mismatches'][:20]:
+            print(f"   t+{m['offset']:.3f}s {m['route']}: recorded {m['recorded']}, replayed {m['replayed']}")
+        raise SystemExit(1)
+    print(f"✅ All {report['matched']} checked responses match the recording")
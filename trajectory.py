@@ -0,0 +1,140 @@
+import hashlib
+import threading
+import numpy as np
+
+# Trajectory fingerprints for spotting one recorded mouse path replayed in
+# many sessions. Only the first MAX_POINTS mouse points are used, so a
+# fingerprint costs the same for every session.
+MAX_POINTS = 256
+GRID = 8  # pixels per grid cell
+MIN_CELLS = 16  # paths through fewer distinct cells are too short to judge
+NUM_HASHES = 64
+BANDS = 16  # LSH bands of NUM_HASHES // BANDS hashes each
+
+_rng = np.random.default_rng(2024)
+_SEEDS = _rng.integers(1, 2**63, size=NUM_HASHES, dtype=np.uint64)
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+def trajectory_cells(mouse_x, mouse_y):
+    """
+    Set of grid cells a mouse path passes through (as uint64), measured
+    from its first point: the summed, quantized moves. The same path
+    started anywhere on the screen gives the same cells, and a pixel or
+    two of jitter only moves the points right at a cell border.
+    (Quantizing each move on its own would let jitter change most moves.)
+    """
+    if len(mouse_x) == 0:
+        return np.empty(0, dtype=np.uint64)
+    qx = np.floor((mouse_x - mouse_x[0]) / GRID).astype(np.int64) + (1 << 20)
+    qy = np.floor((mouse_y - mouse_y[0]) / GRID).astype(np.int64) + (1 << 20)
+    return np.unique(((qx << 21) | qy).astype(np.uint64))
+
+def minhash(cells):
+    """NUM_HASHES-value MinHash signature of a set of uint64 values"""
+    with np.errstate(over='ignore'):
+        hashed = (cells[None, :] ^ _SEEDS[:, None]) * _MULTIPLIER
+        hashed ^= hashed >> np.uint64(29)
+    return hashed.min(axis=1)
+
+def band_keys(signature):
+    """One bytes key per LSH band; similar sessions share some band keys"""
+    rows = NUM_HASHES // BANDS
+    return [bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes() for band in range(BANDS)]
+
+class RotatingBloomFilter:
+    """
+    Two generations of Bloom filters: keys go into the current one, lookups
+    check both. When the current one holds `capacity` keys it becomes the
+    previous one and a fresh filter takes its place, so memory stays fixed
+    and old keys age out.
+    """
+    
+    def __init__(self, bits=2**24, hashes=3, capacity=500000):
+        self.bits = bits
+        self.hashes = hashes
+        self.capacity = capacity
+        self.current = np.zeros(bits // 8, dtype=np.uint8)
+        self.previous = np.zeros(bits // 8, dtype=np.uint8)
+        self.count = 0
+        self.rotations = 0
+    
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=4 * self.hashes).digest()
+        return np.frombuffer(digest, dtype=np.uint32) % self.bits
+    
+    def __contains__(self, key):
+        positions = self._positions(key)
+        masks = np.uint8(1) << (positions & 7).astype(np.uint8)
+        byte_index = positions >> 3
+        return bool(((self.current[byte_index] & masks) == masks).all() or
+                    ((self.previous[byte_index] & masks) == masks).all())
+    
+    def add(self, key):
+        if self.count >= self.capacity:
+            self.previous, self.current = self.current, self.previous
+            self.current[:] = 0
+            self.count = 0
+            self.rotations += 1
+        positions = self._positions(key)
+        np.bitwise_or.at(self.current, positions >> 3, np.uint8(1) << (positions & 7).astype(np.uint8))
+        self.count += 1
+
+class ReplayDetector:
+    """
+    Flags sessions whose mouse trajectory matches an earlier session
+    
+    Each session is fingerprinted once (MinHash of its trajectory cells),
+    its LSH band keys are looked up in a rotating Bloom filter and then
+    added to it. A session is `replayed` when at least match_bands of its
+    BANDS bands were seen before: near-identical paths share most bands,
+    unrelated ones almost none. Cost per session doesn't depend on how
+    many sessions came before.
+    """
+    
+    def __init__(self, match_bands=2, bloom=None):
+        self.match_bands = match_bands
+        self.bloom = bloom if bloom is not None else RotatingBloomFilter()
+        self.results = {}  # session_id -> result, so a session never matches itself
+        self.stats = {'fingerprinted': 0, 'replayed': 0, 'too_short': 0}
+        self._lock = threading.Lock()
+    
+    def check(self, session_id, tracker):
+        """
+        {'replayed': bool, 'matched_bands': n} for a session, or None if it
+        doesn't have enough mouse movement yet
+        """
+        result = self.results.get(session_id)
+        if result is not None:
+            return result
+        
+        n = min(len(tracker.mouse_x), len(tracker.mouse_y), MAX_POINTS)
+        cells = trajectory_cells(np.frombuffer(tracker.mouse_x[:n], dtype=np.float64),
+                                 np.frombuffer(tracker.mouse_y[:n], dtype=np.float64))
+        if len(cells) < MIN_CELLS:
+            self.stats['too_short'] += 1
+            return None
+        
+        keys = band_keys(minhash(cells))
+        with self._lock:
+            matched = sum(key in self.bloom for key in keys)
+            for key in keys:
+                self.bloom.add(key)
+        
+        result = {'replayed': matched >= self.match_bands, 'matched_bands': matched}
+        self.results[session_id] = result
+        self.stats['fingerprinted'] += 1
+        self.stats['replayed'] += result['replayed']
+        return result
+    
+    def forget(self, session_ids):
+        """Drop results of removed sessions (their fingerprints stay in the filter)"""
+        for session_id in session_ids:
+            self.results.pop(session_id, None)
+    
+    def get_statistics(self):
+        return {
+            **self.stats,
+            'filter_keys': self.bloom.count,
+            'filter_rotations': self.bloom.rotations,
+            'filter_bytes': self.bloom.current.nbytes + self.bloom.previous.nbytes
+        }
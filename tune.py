@@ -0,0 +1,176 @@
+import argparse
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+from dataset import BinaryDataset, is_binary_dataset
+from model import BotDetector
+
+# Search space for the Random Forest
+PARAM_GRID = {
+    'n_estimators': [25, 50, 100, 200],
+    'max_depth': [5, 10, None],
+    'min_samples_leaf': [1, 5]
+}
+
+# Where --pick saves its model unless -o is given (never the shipped bot_detector.pkl)
+TUNED_MODEL_FILE = 'bot_detector_tuned.pkl'
+
+# Fold data shared by every task in a worker process (memory-mapped)
+_fold_data = {}
+
+def prepare_folds(source, cache_dir, n_folds=5, random_state=42):
+    """
+    Write features, labels and fold assignments to cache_dir once
+    Workers memory-map these files instead of receiving copies per task
+    """
+    if is_binary_dataset(source):
+        dataset = BinaryDataset(source, mmap=False)
+        X, y, feature_names = dataset.X, dataset.y, dataset.feature_names
+    else:
+        df = pd.read_csv(source)
+        feature_names = [c for c in df.columns if c != 'is_bot']
+        X = df[feature_names].to_numpy(dtype=np.float32)
+        y = df['is_bot'].to_numpy(dtype=np.int8)
+    
+    # fold_ids[i] = the fold where row i is in the test set
+    fold_ids = np.zeros(len(y), dtype=np.int8)
+    folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    for fold, (_, test_idx) in enumerate(folds.split(np.zeros(len(y)), y)):
+        fold_ids[test_idx] = fold
+    
+    np.save(os.path.join(cache_dir, 'X.npy'), np.asfortranarray(X, dtype=np.float32))
+    np.save(os.path.join(cache_dir, 'y.npy'), y)
+    np.save(os.path.join(cache_dir, 'folds.npy'), fold_ids)
+    return feature_names
+
+def _init_worker(cache_dir):
+    """Memory-map the cached fold data once per worker process"""
+    _fold_data['X'] = np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r')
+    _fold_data['y'] = np.load(os.path.join(cache_dir, 'y.npy'), mmap_mode='r')
+    _fold_data['folds'] = np.load(os.path.join(cache_dir, 'folds.npy'), mmap_mode='r')
+
+def evaluate_params(params, latency_rounds=50):
+    """
+    Cross-validate one configuration
+    Returns mean accuracy plus single-row and batch inference latency
+    """
+    X, y, folds = _fold_data['X'], _fold_data['y'], _fold_data['folds']
+    accuracies = []
+    single_latencies = []
+    batch_latencies = []
+    
+    for fold in range(int(folds.max()) + 1):
+        test_mask = folds == fold
+        model = RandomForestClassifier(random_state=42, n_jobs=1, **params)
+        model.fit(X[~test_mask], y[~test_mask])
+        
+        X_test = X[test_mask]
+        accuracies.append(float((model.predict(X_test) == y[test_mask]).mean()))
+        
+        # One row at a time, like /api/verify
+        row = np.ascontiguousarray(X_test[:1])
+        start = time.perf_counter()
+        for _ in range(latency_rounds):
+            model.predict_proba(row)
+        single_latencies.append((time.perf_counter() - start) / latency_rounds)
+        
+        # Whole test fold in one call, like offline scoring
+        start = time.perf_counter()
+        model.predict_proba(X_test)
+        batch_latencies.append((time.perf_counter() - start) / len(X_test))
+    
+    return {
+        **params,
+        'accuracy': float(np.mean(accuracies)),
+        'accuracy_std': float(np.std(accuracies)),
+        'latency_ms': float(np.median(single_latencies)) * 1000,
+        'batch_us_per_row': float(np.median(batch_latencies)) * 1e6
+    }
+
+def pareto_frontier(results):
+    """Configurations that no other configuration beats on both accuracy and latency"""
+    frontier = []
+    for r in results:
+        dominated = any(
+            o['accuracy'] >= r['accuracy'] and o['latency_ms'] <= r['latency_ms']
+            and (o['accuracy'] > r['accuracy'] or o['latency_ms'] < r['latency_ms'])
+            for o in results
+        )
+        if not dominated:
+            frontier.append(r)
+    return sorted(frontier, key=lambda r: r['latency_ms'])
+
+def tune(source='training_data.csv', param_grid=PARAM_GRID, n_folds=5, workers=None):
+    """
+    Search the parameter grid in parallel
+    Fold data is prepared once and shared through memory-mapped files
+    """
+    names = list(param_grid)
+    candidates = [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+    
+    with tempfile.TemporaryDirectory(prefix='captcha_tune_') as cache_dir:
+        print(f"📂 Preparing {n_folds} folds from {source}...")
+        prepare_folds(source, cache_dir, n_folds=n_folds)
+        
+        print(f"🔄 Evaluating {len(candidates)} configurations on {workers or os.cpu_count()} processes...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(cache_dir,)) as pool:
+            results = list(pool.map(evaluate_params, candidates))
+    
+    return sorted(results, key=lambda r: (-r['accuracy'], r['latency_ms']))
+
+# python tune.py [training data]: search and print; add --pick N and/or -o FILE to train and save a model
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Search Random Forest parameters (accuracy vs latency)')
+    parser.add_argument('source', nargs='?', default='training_data.csv', help='training data')
+    parser.add_argument('--pick', type=int, metavar='N',
+                        help='train and save frontier point N (as numbered in the output)')
+    parser.add_argument('-o', '--output', default=None,
+                        help=f'model file to save (default with --pick: {TUNED_MODEL_FILE}; '
+                             'without --pick the most accurate configuration is saved)')
+    args = parser.parse_args()
+    source = args.source
+    
+    print("=" * 78)
+    print("HYPERPARAMETER SEARCH (ACCURACY vs LATENCY)")
+    print("=" * 78)
+    
+    start = time.time()
+    results = tune(source)
+    print(f"   ✓ Done in {time.time() - start:.1f}s\n")
+    
+    header = f"{'trees':>6} {'depth':>6} {'leaf':>5} {'accuracy':>10} {'±':>6} {'ms/req':>8} {'µs/row':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['n_estimators']:>6} {str(r['max_depth']):>6} {r['min_samples_leaf']:>5} "
+              f"{r['accuracy']*100:>9.2f}% {r['accuracy_std']*100:>5.2f} "
+              f"{r['latency_ms']:>8.2f} {r['batch_us_per_row']:>8.2f}")
+    
+    frontier = pareto_frontier(results)
+    print("\n🎯 Speed/accuracy frontier (fastest first):")
+    for number, r in enumerate(frontier, 1):
+        print(f"   [{number}] n_estimators={r['n_estimators']}, max_depth={r['max_depth']}, "
+              f"min_samples_leaf={r['min_samples_leaf']}: "
+              f"{r['accuracy']*100:.2f}% at {r['latency_ms']:.2f} ms/request")
+    
+    # Nothing is saved unless asked for (bot_detector.pkl is the shipped model)
+    if args.pick is None and args.output is None:
+        print(f"\n💡 To train and save one: python tune.py {source} --pick N [-o {TUNED_MODEL_FILE}]")
+        raise SystemExit(0)
+    if args.pick is not None and not 1 <= args.pick <= len(frontier):
+        print(f"❌ --pick must be between 1 and {len(frontier)}")
+        raise SystemExit(1)
+    
+    chosen = frontier[args.pick - 1] if args.pick is not None else results[0]
+    params = {name: chosen[name] for name in PARAM_GRID}
+    print(f"\n🏁 Training the chosen model with {params}")
+    detector = BotDetector(**params)
+    detector.train(source)
+    detector.save(args.output or TUNED_MODEL_FILE)
@@ -0,0 +1,147 @@
+import base64
+import json
+import math
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import urllib.request
+from event_frames import encode_mouse, encode_key
+
+# Local test client for the WebSocket event stream in api_async.py
+# Usage: python ws_client.py [human|bot] [host:port]
+# Only uses the standard library, so it runs anywhere.
+
+def start_session(base_url):
+    request = urllib.request.Request(f'{base_url}/api/session/start', data=b'', method='POST')
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())['session_id']
+
+def verify(base_url, session_id):
+    request = urllib.request.Request(
+        f'{base_url}/api/verify', data=json.dumps({'session_id': session_id}).encode(),
+        headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+class WebSocketClient:
+    """
+    Minimal WebSocket client (RFC 6455): handshake, masked frames out,
+    unmasked frames in. Enough to talk to the event stream.
+    """
+    
+    def __init__(self, host, port, path):
+        self.sock = socket.create_connection((host, port))
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((
+            f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+            'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+        ).encode())
+        
+        response = b''
+        while b'\r\n\r\n' not in response:
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                break
+            response += chunk
+        status_line = response.split(b'\r\n')[0].decode()
+        if not status_line.startswith('HTTP/1.1 101'):
+            raise ConnectionError(f'Handshake refused: {status_line}')
+    
+    def send(self, payload, opcode=0x2):
+        # Client frames must be masked
+        mask = os.urandom(4)
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([0x80 | len(payload)])
+        elif len(payload) < 65536:
+            header += bytes([0x80 | 126]) + struct.pack('>H', len(payload))
+        else:
+            header += bytes([0x80 | 127]) + struct.pack('>Q', len(payload))
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.sock.sendall(header + mask + masked)
+    
+    def _read_exact(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError('Connection closed')
+            data += chunk
+        return data
+    
+    def receive(self):
+        """Next (opcode, payload) from the server"""
+        first, second = self._read_exact(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', self._read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', self._read_exact(8))[0]
+        return first & 0x0F, self._read_exact(length)
+    
+    def close(self):
+        try:
+            self.send(struct.pack('>H', 1000), opcode=0x8)
+        finally:
+            self.sock.close()
+
+def listen(client):
+    """Print everything the server pushes"""
+    try:
+        while True:
+            opcode, payload = client.receive()
+            if opcode == 0x8:
+                return
+            message = json.loads(payload)
+            if message['type'] == 'verdict':
+                print(f"\n📡 Live verdict after {message['events']} events: "
+                      f"{message['action']} ({message['probability']*100:.1f}% bot)")
+            else:
+                print(f"\n⚠️  Server: {message}")
+    except (ConnectionError, OSError):
+        pass
+
+def simulate(client, kind, events=200):
+    """Stream a human-like (curvy, irregular) or bot-like (straight, instant) trajectory"""
+    x, y = 100.0, 100.0
+    for i in range(events):
+        if kind == 'human':
+            x += 8 * math.cos(i / 9) + random.gauss(0, 2)
+            y += 6 * math.sin(i / 13) + random.gauss(0, 2)
+            client.send(encode_mouse(x, y))
+            if i % 25 == 0:
+                client.send(encode_key(random.choice('hello')))
+            time.sleep(random.uniform(0.01, 0.04))
+        else:
+            x += 5
+            y += 5
+            client.send(encode_mouse(x, y))
+
+if __name__ == "__main__":
+    kind = sys.argv[1] if len(sys.argv) > 1 else 'human'
+    host, port = (sys.argv[2] if len(sys.argv) > 2 else 'localhost:5000').split(':')
+    base_url = f'http://{host}:{port}'
+    
+    session_id = start_session(base_url)
+    print(f"✅ Session started: {session_id[:8]}...")
+    
+    client = WebSocketClient(host, int(port), f'/api/stream?session_id={session_id}')
+    listener = threading.Thread(target=listen, args=(client,), daemon=True)
+    listener.start()
+    
+    start = time.perf_counter()
+    simulate(client, kind)
+    elapsed = time.perf_counter() - start
+    print(f"🔌 Streamed 200 {kind} mouse events in {elapsed:.2f}s over one WebSocket")
+    
+    time.sleep(0.5)  # Give the server time to push a verdict
+    client.close()
+    
+    result = verify(base_url, session_id)
+    print(f"🔍 /api/verify: {result['action']} ({result['probability']*100:.1f}% bot)")